@@ -0,0 +1,289 @@
+"""
+Endpoint benchmark for the backend, run in-process against every city in data/.
+
+Requests go through httpx's ASGI transport straight into the FastAPI app, so
+the numbers cover routing, the data service and serialization without network
+noise. Each endpoint is driven at every concurrency level and reported with
+p50/p95/p99 latency, throughput, bytes on the wire and RSS growth, overall,
+per city size class and per city.
+
+Needs httpx (pip install -r requirements-dev.txt).
+
+Usage (from backend/):
+    python benchmark.py                                   # all cities, write benchmark.json
+    python benchmark.py --cities chennai indore -c 1,16   # subset
+    python benchmark.py --cold                            # empty the city cache before each run
+    python benchmark.py --compare baseline.json --threshold 10
+"""
+import argparse
+import asyncio
+import json
+import platform
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+import main
+
+ENDPOINTS = ('cities', 'cities_population', 'city', 'city_stats', 'apply_policy')
+
+# data.json size classes, in bytes
+SIZE_CLASSES = (('small', 128 * 1024), ('medium', 512 * 1024), ('large', None))
+
+# Metrics where a higher value is better, all others are latencies or sizes
+HIGHER_IS_BETTER = {'throughput_rps'}
+
+
+def size_class(city: str) -> str:
+    size = (main.data_service.data_dir / city / "data.json").stat().st_size
+    for name, limit in SIZE_CLASSES:
+        if limit is None or size < limit:
+            return name
+    return SIZE_CLASSES[-1][0]
+
+
+def policy_body(city: str) -> Dict[str, Any]:
+    """Every third ward at 50% intensity"""
+    wards = main.data_service.load_dataset(city).feature_count
+    return {'city': city, 'selected_roads': list(range(0, wards, 3)), 'pricing_intensity': 50.0}
+
+
+def build_requests(endpoint: str, cities: List[str], repeat: int) -> List[Dict[str, Any]]:
+    """Requests of one run: the city-independent endpoints are repeated once per city"""
+    requests = []
+    for _ in range(repeat):
+        for city in cities:
+            if endpoint == 'cities':
+                requests.append({'city': city, 'method': 'GET', 'url': '/cities'})
+            elif endpoint == 'cities_population':
+                requests.append({'city': city, 'method': 'GET', 'url': '/cities/population'})
+            elif endpoint == 'city':
+                requests.append({'city': city, 'method': 'GET', 'url': f'/city/{city}'})
+            elif endpoint == 'city_stats':
+                requests.append({'city': city, 'method': 'GET', 'url': f'/city/{city}/stats'})
+            elif endpoint == 'apply_policy':
+                requests.append({'city': city, 'method': 'POST', 'url': '/apply_policy', 'json': policy_body(city)})
+    return requests
+
+
+# Interval at which RSS is sampled while an endpoint runs, in seconds
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def peak_rss_mb() -> float:
+    """Highest RSS of the whole process so far"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def rss_mb() -> Optional[float]:
+    """Current RSS, None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+async def sample_rss(stop: asyncio.Event, peak: List[float]) -> None:
+    """Keep the highest current RSS in peak[0] until stop is set"""
+    while not stop.is_set():
+        current = rss_mb()
+        if current is None:
+            return
+        peak[0] = max(peak[0], current)
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def summarize(latencies: List[float], sizes: List[int]) -> Dict[str, Any]:
+    if not latencies:
+        return {'requests': 0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+        'bytes_total': int(sum(sizes)),
+        'bytes_mean': float(np.mean(sizes)),
+    }
+
+
+async def run_endpoint(client: httpx.AsyncClient, endpoint: str, cities: List[str], concurrency: int,
+                       repeat: int, cold: bool, city_classes: Dict[str, str]) -> Dict[str, Any]:
+    """Send all requests of one endpoint with at most `concurrency` in flight"""
+    requests = build_requests(endpoint, cities, repeat)
+    if cold:
+        main.data_service.cache.invalidate()
+
+    cache_before = main.data_service.cache_stats()
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[Dict[str, Any]] = []
+    errors = 0
+
+    async def send(spec: Dict[str, Any]) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(spec['method'], spec['url'], json=spec.get('json'))
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            errors += 1
+            return
+        samples.append({'city': spec['city'], 'latency': elapsed, 'bytes': response.num_bytes_downloaded})
+
+    # RSS growth is measured per run; the process-wide peak would repeat the largest run so far
+    rss_before = rss_mb()
+    rss_peak = [rss_before or 0.0]
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(sample_rss(stop, rss_peak))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(spec) for spec in requests))
+    wall = time.perf_counter() - started
+    stop.set()
+    await sampler
+    rss_after = rss_mb()
+    cache_after = main.data_service.cache_stats()
+
+    result = {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'errors': errors,
+        'wall_s': wall,
+        'throughput_rps': len(samples) / wall if wall else 0.0,
+        **summarize([s['latency'] for s in samples], [s['bytes'] for s in samples]),
+        # Growth of the current RSS over the run: the highest sample and what is still held at the end
+        'rss_peak_delta_mb': rss_peak[0] - rss_before if rss_before is not None else None,
+        'rss_delta_mb': rss_after - rss_before if rss_before is not None else None,
+        # City cache misses show when the run does not fit in CITY_CACHE_MAX_ENTRIES
+        'cache_misses': cache_after['misses'] - cache_before['misses'],
+        'cache_evictions': cache_after['evictions'] - cache_before['evictions'],
+    }
+
+    if endpoint not in ('cities', 'cities_population'):
+        by_size: Dict[str, Any] = {}
+        for name, _ in SIZE_CLASSES:
+            group = [s for s in samples if city_classes[s['city']] == name]
+            if group:
+                by_size[name] = summarize([s['latency'] for s in group], [s['bytes'] for s in group])
+        by_city = {}
+        for city in cities:
+            group = [s for s in samples if s['city'] == city]
+            if group:
+                stats = summarize([s['latency'] for s in group], [s['bytes'] for s in group])
+                by_city[city] = {'p50_ms': stats['p50_ms'], 'bytes_mean': stats['bytes_mean']}
+        result['by_size'] = by_size
+        result['by_city'] = by_city
+
+    return result
+
+
+async def run_benchmark(cities: List[str], endpoints: List[str], levels: List[int], repeat: int,
+                        cold: bool, encoding: str) -> Dict[str, Any]:
+    city_classes = {city: size_class(city) for city in cities}
+    headers = {'accept-encoding': encoding}
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", headers=headers,
+                                 timeout=None) as client:
+        if not cold:
+            # One untimed pass so every run measures warm caches
+            for endpoint in endpoints:
+                await run_endpoint(client, endpoint, cities, max(levels), 1, False, city_classes)
+        for concurrency in levels:
+            for endpoint in endpoints:
+                result = await run_endpoint(client, endpoint, cities, concurrency, repeat, cold, city_classes)
+                results.append(result)
+                print(f"{endpoint:<18} c={concurrency:<3} p50 {result.get('p50_ms', 0):8.2f} ms  "
+                      f"p95 {result.get('p95_ms', 0):8.2f} ms  p99 {result.get('p99_ms', 0):8.2f} ms  "
+                      f"{result['throughput_rps']:8.1f} req/s  {result.get('bytes_mean', 0) / 1024:9.1f} KiB  "
+                      + (f"rss +{result['rss_peak_delta_mb']:.1f} MB  " if result['rss_peak_delta_mb'] is not None else "")
+                      + (f"errors {result['errors']}" if result['errors'] else ""))
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cities': len(cities),
+            'size_classes': {name: sum(1 for c in city_classes.values() if c == name) for name, _ in SIZE_CLASSES},
+            'concurrency': levels,
+            'repeat': repeat,
+            'cold': cold,
+            'accept_encoding': encoding,
+            'peak_rss_mb': peak_rss_mb(),
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], metrics: List[str],
+            threshold: float) -> List[str]:
+    """Describe every metric that got worse than the baseline by more than threshold percent"""
+    previous = {(r['endpoint'], r['concurrency']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        key = (result['endpoint'], result['concurrency'])
+        if key not in previous:
+            continue
+        for metric in metrics:
+            old, new = previous[key].get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            status = "REGRESSION" if worse > threshold else "ok"
+            line = f"{key[0]:<18} c={key[1]:<3} {metric:<15} {old:10.2f} -> {new:10.2f} ({change:+6.1f}%) {status}"
+            print(line)
+            if worse > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API endpoints in-process")
+    parser.add_argument("--cities", nargs="*", help="Cities to benchmark (default: every city in data/)")
+    parser.add_argument("--endpoints", nargs="*", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("-c", "--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--repeat", type=int, default=3, help="Requests per city and endpoint at each level")
+    parser.add_argument("--cold", action="store_true", help="Empty the city cache before each run")
+    parser.add_argument("--encoding", default="br, gzip", help="Accept-Encoding sent with every request")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="Where to write the results")
+    parser.add_argument("--compare", help="Baseline results to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    parser.add_argument("--metrics", default="p50_ms,p95_ms,throughput_rps", help="Metrics checked by --compare")
+    args = parser.parse_args(argv)
+
+    cities = args.cities or main.city_registry.cities
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    results = asyncio.run(run_benchmark(cities, args.endpoints, levels, args.repeat, args.cold, args.encoding))
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(results, baseline, args.metrics.split(','), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:g}%")
+            return 1
+        print(f"No regressions above {args.threshold:g}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,104 @@
+# Bounded thread pool for blocking work called from async handlers
+#
+# File reads, JSON parsing and NumPy work run in the pool instead of on the
+# event loop, so one cold load of a large city does not stall other requests.
+# run_once() coalesces concurrent calls with the same key: the first caller
+# runs the function, the others await its result.
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import metrics
+
+
+class BlockingPool:
+    """Thread pool with queue depth, wait time and single-flight accounting"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or int(os.environ.get('BLOCKING_POOL_WORKERS', 0)) or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="blocking")
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.wait_seconds = metrics.Histogram('blocking_pool_wait_seconds', "Time tasks waited for a pool thread",
+                                              (), metrics.LATENCY_BUCKETS)
+        self.run_seconds = metrics.Histogram('blocking_pool_run_seconds', "Time tasks ran on a pool thread",
+                                             (), metrics.LATENCY_BUCKETS)
+
+    def _task(self, context: contextvars.Context, fn: Callable[..., Any], args: tuple, submitted: float) -> Any:
+        started = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds.observe((), started - submitted)
+        try:
+            # Run in the caller's context so phase timings reach its request
+            return context.run(fn, *args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_seconds.observe((), time.perf_counter() - started)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) on a pool thread and await its result"""
+        if kwargs:
+            fn = functools.partial(fn, **kwargs)
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._task, contextvars.copy_context(), fn, args,
+                                          time.perf_counter())
+
+    async def run_once(self, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Like run(), but concurrent calls with the same key share one execution"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.run(fn, *args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        # shield: a caller that goes away must not cancel the work the others are waiting for
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved even when every caller has gone away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'coalesced': self.coalesced,
+                'single_flight_keys': len(self._inflight),
+            }
+
+    def metric_lines(self) -> List[str]:
+        stats = self.stats()
+        lines = metrics.gauge_lines('blocking_pool_workers', "Threads in the blocking pool", stats['workers'])
+        lines += metrics.gauge_lines('blocking_pool_queue_depth', "Tasks waiting for a pool thread", stats['queued'])
+        lines += metrics.gauge_lines('blocking_pool_running', "Tasks running on a pool thread", stats['running'])
+        lines += metrics.gauge_lines('blocking_pool_completed_total', "Tasks completed", stats['completed'], "counter")
+        lines += metrics.gauge_lines('blocking_pool_coalesced_total', "Calls that joined an in-flight task",
+                                     stats['coalesced'], "counter")
+        with self._lock:
+            lines += self.wait_seconds.render() + self.run_seconds.render()
+        return lines
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,286 @@
+# HTTP response helpers: strong ETags, conditional GETs, precompressed bodies and fast JSON encoding
+import gzip
+import hashlib
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+
+from metrics import phase
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder is the fallback
+    orjson = None
+
+# Seconds clients and CDNs may reuse a response before revalidating it
+CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 300))
+
+# File suffixes of precompressed bodies
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# Brotli 10-11 compress ~25% smaller but take seconds on the largest cities
+BROTLI_QUALITY = int(os.environ.get('HTTP_BROTLI_QUALITY', 9))
+
+# Streamed bodies are compressed while they are produced, so favour speed
+STREAM_BROTLI_QUALITY = 5
+STREAM_GZIP_LEVEL = 6
+
+
+def _encode_default(value):
+    """Encode NumPy arrays and scalars with the stdlib encoder"""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_bytes(content: Any) -> bytes:
+    """Compact JSON of plain data (dicts, lists, NumPy arrays), with orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, separators=(',', ':'), default=_encode_default).encode()
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """JSON response for trusted data, skipping FastAPI's response_model revalidation and encoder
+
+    Models are serialized by pydantic-core as they are; everything else goes
+    through json_bytes.
+    """
+    with phase('serialize'):
+        if isinstance(content, BaseModel):
+            body = content.model_dump_json().encode()
+        else:
+            body = json_bytes(content)
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def _content_etag(digest) -> str:
+    return '"' + digest.hexdigest()[:32] + '"'
+
+
+def _variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """ETag of the identity body or of one compressed variant (each representation has its own)"""
+    if encoding is None:
+        return etag
+    return etag[:-1] + '-' + encoding + '"'
+
+
+class CachedBody:
+    """Serialized response body with a content-hash ETag and lazily compressed variants"""
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.body = body
+        self.media_type = media_type
+        self.etag = _content_etag(hashlib.sha256(body))
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_model(cls, model: BaseModel) -> 'CachedBody':
+        with phase('serialize'):
+            return cls(model.model_dump_json().encode())
+
+    def write_files(self, path: Path, brotli_quality: int = 11) -> List[Path]:
+        """Store the body and its gzip/br variants (compressed at full quality) for FileBody"""
+        path = Path(path)
+        files = {path: self.body}
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            if encoding == 'br' and brotli is None:
+                continue
+            data = (brotli.compress(self.body, quality=brotli_quality) if encoding == 'br'
+                    else self._compress(encoding))
+            files[path.with_name(path.name + suffix)] = data
+        for target, data in files.items():
+            tmp_path = target.with_name(target.name + f".tmp{os.getpid()}")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, target)
+        return list(files)
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the body and the compressed variants kept so far"""
+        return len(self.body) + sum(len(data) for data in list(self._encoded.values()))
+
+    def variant_etag(self, encoding: Optional[str]) -> str:
+        return _variant_etag(self.etag, encoding)
+
+    def can_encode(self, encoding: str) -> bool:
+        return encoding != 'br' or brotli is not None
+
+    def is_encoded(self, encoding: str) -> bool:
+        return encoding in self._encoded
+
+    def encoded(self, encoding: str) -> bytes:
+        """Body compressed with gzip or br, compressed once and kept in memory"""
+        if encoding not in self._encoded:
+            with self._lock:
+                if encoding not in self._encoded:
+                    with phase('compress'):
+                        self._encoded[encoding] = self._compress(encoding)
+        return self._encoded[encoding]
+
+    def response(self, encoding: Optional[str], headers: Dict[str, str]) -> Response:
+        body = self.body if encoding is None else self.encoded(encoding)
+        return Response(content=body, media_type=self.media_type, headers=headers)
+
+    def _compress(self, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(self.body, quality=BROTLI_QUALITY)
+        return gzip.compress(self.body, compresslevel=9, mtime=0)
+
+
+class FileBody:
+    """Body stored by CachedBody.write_files(), served straight from its files
+
+    Neither the body nor its compressed variants are read into the heap:
+    responses stream the files (with sendfile where the server supports it),
+    so every worker shares them through the page cache. Only the ETag is kept.
+    """
+
+    nbytes = 0
+
+    def __init__(self, path: Path, media_type: str = "application/json"):
+        self.path = Path(path)
+        self.media_type = media_type
+        digest = hashlib.sha256()
+        with phase('file_read'), open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+            self.size = os.fstat(f.fileno()).st_size
+        self.etag = _content_etag(digest)
+        variants = {encoding: self.path.with_name(self.path.name + suffix)
+                    for encoding, suffix in ENCODING_SUFFIXES.items()}
+        self._variants = {encoding: p for encoding, p in variants.items() if p.exists()}
+
+    def variant_etag(self, encoding: Optional[str]) -> str:
+        return _variant_etag(self.etag, encoding)
+
+    def can_encode(self, encoding: str) -> bool:
+        return encoding in self._variants
+
+    def is_encoded(self, encoding: str) -> bool:
+        return True
+
+    def response(self, encoding: Optional[str], headers: Dict[str, str]) -> Response:
+        path = self.path if encoding is None else self._variants[encoding]
+        return FileResponse(path, media_type=self.media_type, headers=headers)
+
+
+def _accepted_encodings(request: Request) -> Dict[str, float]:
+    """Parse Accept-Encoding into {coding: q}"""
+    accepted = {}
+    for part in request.headers.get('accept-encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match against an ETag (weak comparison, as RFC 9110 requires for GET)"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+
+
+def negotiate_encoding(request: Request, cached: Union[CachedBody, FileBody]) -> Optional[str]:
+    """Content coding cached_response() will send for this request, or None for identity"""
+    if cached.size < MIN_COMPRESS_SIZE:
+        return None
+    accepted = _accepted_encodings(request)
+    for encoding in ('br', 'gzip'):
+        if accepted.get(encoding, 0) > 0 and cached.can_encode(encoding):
+            return encoding
+    return None
+
+
+def pending_encoding(request: Request, cached: Union[CachedBody, FileBody]) -> Optional[str]:
+    """Coding this request needs that has not been compressed yet (None when it will get a 304)"""
+    encoding = negotiate_encoding(request, cached)
+    if encoding is None or cached.is_encoded(encoding) or _etag_matches(request, cached.variant_etag(encoding)):
+        return None
+    return encoding
+
+
+def cached_response(request: Request, cached: Union[CachedBody, FileBody], max_age: Optional[int] = None) -> Response:
+    """Serve a cached body: 304 when the client copy is current, otherwise the best precompressed variant
+
+    Each coding is a separate representation with its own ETag, and the 304
+    carries the same Vary as the full response.
+    """
+    encoding = negotiate_encoding(request, cached)
+    headers = {
+        'ETag': cached.variant_etag(encoding),
+        'Cache-Control': f"public, max-age={CACHE_MAX_AGE if max_age is None else max_age}",
+        'Vary': 'Accept-Encoding',
+    }
+
+    if _etag_matches(request, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return cached.response(encoding, headers)
+
+
+def stream_encoding(request: Request) -> Optional[str]:
+    """Content coding for a streamed response, or None for identity"""
+    accepted = _accepted_encodings(request)
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Compress a stream chunk by chunk, flushing after each so the client can decode it as it arrives"""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=STREAM_BROTLI_QUALITY)
+        for chunk in chunks:
+            with phase('compress'):
+                out = compressor.process(chunk) + compressor.flush()
+            yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(STREAM_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            with phase('compress'):
+                out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield out
+        yield compressor.flush()
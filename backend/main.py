@@ -1,227 +1,300 @@
-from fastapi import FastAPI, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-from pathlib import Path
-from typing import List, Dict, Any
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Union
 import json
-import pandas as pd
+import logging
+
+from models import (CityEmissionData, PolicyRequest, PolicyResponse, PolicySweepRequest, PolicySweepResponse,
+                    NationalPolicyRequest, EmissionStats, PointLookupResponse, BBoxQueryResponse,
+                    WardOptimizationRequest, WardOptimizationResponse)
+from services.simple_data_service import SimpleDataService, CITY_FIELDS, MAX_SWEEP_SCENARIOS
+from services.national_index import NationalIndex
+from services.city_registry import CityRegistry
+from services.geometry_lod import MAX_LOD
+from services.grid_tiles import GRID_HEADERS
+from http_cache import (CachedBody, FileBody, cached_response, pending_encoding, json_bytes, json_response, stream_encoding,
+                        compress_chunks, CACHE_MAX_AGE)
+from blocking_pool import BlockingPool
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds spent in each startup phase, in order, reported by /startup
+startup_phases: Dict[str, float] = {'imports': (time.perf_counter() - _import_started) * 1000}
+_first_response_ms: Optional[float] = None
 
-from models import CityEmissionData, PolicyRequest, PolicyResponse, EmissionStats
-from services.simple_data_service import SimpleDataService
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    yield
+    startup_phases[name] = (time.perf_counter() - started) * 1000
 
 # Initialize FastAPI app
-app = FastAPI(
-    title="City Emissions Simulator API",
-    description="API for simulating emissions reduction through congestion pricing policies",
-    version="1.0.0"
-)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "https://localhost:3000",
-        "https://congestion-pricing-dashboard.vercel.app",
-        "https://*.vercel.app",
-        "*"  # Allow all origins for production (you can restrict this later)
-    ],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
-)# Initialize data service
-data_service = SimpleDataService()
-
-# City coordinates mapping (lat, lng)
-CITY_COORDINATES = {
-    'kohima': [25.6747, 94.1100],
-    'panaji': [15.4909, 73.8278],
-    'itanagar': [27.0844, 93.6053],
-    'gangtok': [27.3389, 88.6065],
-    'shilong': [25.5788, 91.8933],
-    'nalgonda': [17.0575, 79.2671],
-    'shimla': [31.1048, 77.1734],
-    'imphal': [24.8170, 93.9368],
-    'rourkela': [22.2604, 84.8536],
-    'siliguri': [26.7271, 88.3953],
-    'durgapur': [23.5204, 87.3119],
-    'dewas': [22.9659, 76.0553],
-    'aizawl': [23.7271, 92.7176],
-    'haldia': [22.0667, 88.0698],
-    'sagar': [23.8388, 78.7378],
-    'jabalpur': [23.1815, 79.9864],
-    'thoothukkudi': [8.7642, 78.1348],
-    'shivamogga': [13.9299, 75.5681],
-    'kurnool': [15.8222, 78.0350],
-    'jalpaiguri': [26.5170, 88.7196],
-    'korba': [22.3475, 82.6966],
-    'alwar': [27.5529, 76.6346],
-    'silchar': [24.8273, 92.7979],
-    'udaipur': [24.5854, 73.7125],
-    'erode': [11.3410, 77.7172],
-    'muzaffarpur': [26.1220, 85.3906],
-    'ujjain': [23.1793, 75.7849],
-    'kolhapur': [16.7050, 74.2433],
-    'agartala': [23.8315, 91.2868],
-    'sangli-miraj-kupwad': [16.8524, 74.5815],
-    'gaya': [24.7969, 85.0002],
-    'nellore': [14.4426, 79.9865],
-    'jalgaon': [21.0077, 75.5626],
-    'bhilainagar': [21.1950, 81.3509],
-    'jhansi': [25.4484, 78.5685],
-    'mangaluru': [12.9141, 74.8560],
-    'patiala': [30.3398, 76.3869],
-    'amravati': [20.9374, 77.7796],
-    'dehradun': [30.3165, 78.0322],
-    'guntur': [16.3067, 80.4365],
-    'firozabad': [27.1496, 78.3949],
-    'tiruppur': [11.1085, 77.3411],
-    'chandigarh': [30.7333, 76.7794],
-    'cuttack': [20.4625, 85.8828],
-    'warangal': [17.9784, 79.5941],
-    'mysuru': [12.2958, 76.6394],
-    'jammu': [32.7266, 74.8570],
-    'srinagar': [34.0837, 74.7973],
-    'bhubaneswar': [20.2961, 85.8245],
-    'vijaywada': [16.5062, 80.6480],
-    'aligarh': [27.8974, 78.0880],
-    'jodhpur': [26.2389, 73.0243],
-    'hubli dharwad': [15.3647, 75.1240],
-    'kochi': [9.9312, 76.2673],
-    'solapur': [17.6599, 75.9064],
-    'tiruchirappalli': [10.7905, 78.7047],
-    'gurgaon': [28.4595, 77.0266],
-    'jalandhar': [31.3260, 75.5762],
-    'guwahati': [26.1445, 91.7362],
-    'amritsar': [31.6340, 74.8723],
-    'raipur': [21.2514, 81.6296],
-    'bareilly': [28.3670, 79.4304],
-    'kota': [25.2138, 75.8648],
-    'noida': [28.5355, 77.3910],
-    'rajkot': [22.3039, 70.8022],
-    'moradabad': [28.8386, 78.7733],
-    'aurangabad': [19.8762, 75.3433],
-    'ranchi': [23.3441, 85.3096],
-    'gwalior': [26.2183, 78.1828],
-    'jamshedpur': [22.8046, 86.2029],
-    'coimbatore': [11.0168, 76.9558],
-    'meerut': [28.9845, 77.7064],
-    'dhanbad': [23.7957, 86.4304],
-    'allahabad': [25.4358, 81.8463],
-    'madurai': [9.9252, 78.1198],
-    'nashik': [19.9975, 73.7898],
-    'ludhiana': [30.9005, 75.8573],
-    'faridabad': [28.4089, 77.3178],
-    'vadodara': [22.3072, 73.1812],
-    'varanashi': [25.3176, 82.9739],
-    'agra': [27.1767, 78.0081],
-    'thiruvananthapuram': [8.5241, 76.9366],
-    'vishakhapatnam': [17.6868, 83.2185],
-    'patna': [25.5941, 85.1376],
-    'ghaziabad': [28.6692, 77.4538],
-    'bhopal': [23.2599, 77.4126],
-    'nagpur': [21.1458, 79.0882],
-    'indore': [22.7196, 75.8577],
-    'kanpur': [26.4499, 80.3319],
-    'jaipur': [26.9124, 75.7873],
-    'lucknow': [26.8467, 80.9462],
-    'pune': [18.5204, 73.8567],
-    'surat': [21.1702, 72.8311],
-    'kolkata': [22.5726, 88.3639],
-    'hyderabad': [17.3850, 78.4867],
-    'chennai': [13.0827, 80.2707],
-    'ahmedabad': [23.0225, 72.5714],
-    'bengaluru': [12.9716, 77.5946],
-    'mumbai': [19.0760, 72.8777],
-    'delhi': [28.6139, 77.2090]
-}
-
-# City list
-CITIES = [
-    'kohima', 'panaji', 'itanagar', 'gangtok', 'shilong', 'nalgonda', 'shimla', 'imphal', 'rourkela', 'siliguri',
-    'durgapur', 'dewas', 'aizawl', 'haldia', 'sagar', 'jabalpur', 'thoothukkudi', 'shivamogga', 'kurnool', 
-    'jalpaiguri', 'korba', 'alwar', 'silchar', 'udaipur', 'erode', 'muzaffarpur', 'ujjain', 'kolhapur', 
-    'agartala', 'sangli-miraj-kupwad', 'gaya', 'nellore', 'jalgaon', 'bhilainagar', 'jhansi', 'mangaluru', 
-    'patiala', 'amravati', 'dehradun', 'guntur', 'firozabad', 'tiruppur', 'chandigarh', 'cuttack', 'warangal', 
-    'mysuru', 'jammu', 'srinagar', 'bhubaneswar', 'vijaywada', 'aligarh', 'jodhpur', 'hubli dharwad', 'kochi', 
-    'solapur', 'tiruchirappalli', 'gurgaon', 'jalandhar', 'guwahati', 'amritsar', 'raipur', 'bareilly', 'kota', 
-    'noida', 'rajkot', 'moradabad', 'aurangabad', 'ranchi', 'gwalior', 'jamshedpur', 'coimbatore', 'meerut', 
-    'dhanbad', 'allahabad', 'madurai', 'nashik', 'ludhiana', 'faridabad', 'vadodara', 'varanashi', 'agra', 
-    'thiruvananthapuram', 'vishakhapatnam', 'patna', 'ghaziabad', 'bhopal', 'nagpur', 'indore', 'kanpur', 
-    'jaipur', 'lucknow', 'pune', 'surat', 'kolkata', 'hyderabad', 'chennai', 'ahmedabad', 'bengaluru', 'mumbai', 'delhi'
-]
+with startup_phase('app'):
+    app = FastAPI(
+        title="City Emissions Simulator API",
+        description="API for simulating emissions reduction through congestion pricing policies",
+        version="1.0.0"
+    )
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:3000",
+            "http://127.0.0.1:3000",
+            "https://localhost:3000",
+            "https://congestion-pricing-dashboard.vercel.app",
+            "https://*.vercel.app",
+            "*"  # Allow all origins for production (you can restrict this later)
+        ],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        allow_headers=["*"],
+        expose_headers=GRID_HEADERS,
+    )
+
+# Initialize data service
+with startup_phase('data_service'):
+    data_service = SimpleDataService()
+
+# Cities with a data file, plus the population rows of the India map
+with startup_phase('city_registry'):
+    city_registry = CityRegistry.load(data_service.data_dir)
+
+# Cross-city summary index, refreshed incrementally when a city file changes
+with startup_phase('national_index'):
+    national_index = NationalIndex(data_service.data_dir, service=data_service)
+
+# File reads, parsing and NumPy work run here instead of on the event loop
+blocking_pool = BlockingPool()
+
+# Serialized bodies of responses that only change on redeploy
+_static_bodies: Dict[str, CachedBody] = {}
+
+def static_body(key: str, build) -> CachedBody:
+    """Serialize a static response once per process"""
+    if key not in _static_bodies:
+        _static_bodies[key] = CachedBody(json.dumps(build(), separators=(',', ':')).encode())
+    return _static_bodies[key]
+
+with startup_phase('static_bodies'):
+    static_body('cities', lambda: city_registry.cities)
+    static_body('cities/population', lambda: city_registry.population_table)
+
+# Request latency, phase and payload size histograms served by /metrics
+request_metrics = metrics.MetricsRegistry()
+
+def cache_metric_lines() -> List[str]:
+    stats = data_service.cache_stats()
+    lines = metrics.gauge_lines('city_cache_entries', "Cities held in the data cache", stats['entries'])
+    lines += metrics.gauge_lines('city_cache_bytes', "Approximate bytes held by the cached cities", stats['bytes'])
+    for name in ('hits', 'misses', 'evictions', 'invalidations', 'coalesced'):
+        lines += metrics.gauge_lines(f'city_cache_{name}_total', f"City data cache {name}", stats[name], "counter")
+    return lines
+
+request_metrics.add_collector(cache_metric_lines)
+request_metrics.add_collector(blocking_pool.metric_lines)
+
+async def send_cached(request: Request, body: Union[CachedBody, FileBody]) -> Response:
+    """cached_response(), compressing a variant that is not cached yet on the blocking pool"""
+    encoding = pending_encoding(request, body)
+    if encoding is not None:
+        await blocking_pool.run_once(('encode', body.etag, encoding), body.encoded, encoding)
+    return cached_response(request, body)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request, labelled by route template and city, with its phase breakdown
+
+    The request is recorded once its body has been sent, so streamed responses
+    are timed (and sized) to their last chunk rather than to their headers.
+    """
+    global _first_response_ms
+    started = time.perf_counter()
+    with metrics.track_request() as tracked:
+        response = await call_next(request)
+    
+    route = request.scope.get('route')
+    tracked.endpoint = route.path if route is not None else "unmatched"
+    city = tracked.city or request.path_params.get('city', "")
+    # Label only registered cities, so requests for arbitrary names cannot add series
+    tracked.city = city if not city or city in city_registry else "unknown"
+    
+    body_iterator = response.body_iterator
+    async def record_when_sent():
+        size = 0
+        try:
+            async for chunk in body_iterator:
+                size += len(chunk)
+                yield chunk
+        finally:
+            duration = time.perf_counter() - started
+            request_metrics.record(tracked, response.status_code, duration, size)
+            metrics.log_if_slow(request.method, request.url.path, tracked, response.status_code, duration)
+    response.body_iterator = record_when_sent()
+    
+    if _first_response_ms is None:
+        _first_response_ms = (time.perf_counter() - _import_started) * 1000
+        logger.info("First response %.1f ms after startup began", _first_response_ms)
+    return response
+
+@app.on_event("startup")
+def log_startup_timing():
+    startup_phases['total'] = (time.perf_counter() - _import_started) * 1000
+    logger.info("Startup: %s", ", ".join(f"{name} {ms:.1f} ms" for name, ms in startup_phases.items()))
+
+@app.on_event("shutdown")
+def shutdown_pools():
+    national_index.shutdown()
+    blocking_pool.shutdown()
 
 @app.get("/")
 async def root():
-    return {"message": "City Emissions Simulator API", "version": "1.0.0", "cities_count": len(CITIES)}
+    return {"message": "City Emissions Simulator API", "version": "1.0.0", "cities_count": len(city_registry)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, phase and payload size histograms and cache counters in Prometheus text format"""
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/startup")
+async def get_startup_timing():
+    """Get time spent in each startup phase and until the first response, in milliseconds
+
+    Times are measured from the import of this module, so interpreter and server
+    start-up before it are not included.
+    """
+    return {
+        'phases': startup_phases,
+        'first_response_ms': _first_response_ms,
+        'cities': len(city_registry),
+    }
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get city data cache counters (hits, misses, evictions, occupancy)"""
+    return data_service.cache_stats()
+
 @app.get("/cities", response_model=List[str])
-async def get_cities():
+async def get_cities(request: Request):
     """Get list of all available cities"""
-    return CITIES
+    return cached_response(request, static_body('cities', lambda: city_registry.cities))
 
 @app.get("/cities/population")
-async def get_cities_with_population():
+async def get_cities_with_population(request: Request):
     """Get cities with their population data for the India map"""
     try:
-        # Load the static data CSV from data folder - robust path resolution
-        current_dir = Path(__file__).parent
-        csv_path = None
-        
-        # Try different possible locations for the CSV file
-        possible_paths = [
-            current_dir.parent / "data" / "others" / "df_static.csv",  # ../data/others/
-            current_dir / "data" / "others" / "df_static.csv",         # ./data/others/
-            Path("data/others/df_static.csv"),                        # relative to cwd
-            Path("/tmp/data/others/df_static.csv"),                   # temporary storage
-        ]
-        
-        for path in possible_paths:
-            if path.exists():
-                csv_path = path
-                break
-        
-        if csv_path is None:
-            raise FileNotFoundError("df_static.csv not found in any expected location")
-            
-        df = pd.read_csv(csv_path)
-        
-        # Create a list of cities with their data
-        cities_data = []
-        for _, row in df.iterrows():
-            city_name = row['city'].lower()
-            if city_name in CITIES:
-                coordinates = CITY_COORDINATES.get(city_name)
-                if coordinates:  # Only include cities we have coordinates for
-                    cities_data.append({
-                        "name": city_name,
-                        "display_name": row['city'].title(),
-                        "population": int(row['population_2020']),
-                        "state": row['state'],
-                        "coordinates": coordinates,
-                        "lat": coordinates[0],
-                        "lng": coordinates[1]
-                    })
-        
-        return cities_data
+        return cached_response(request, static_body('cities/population', lambda: city_registry.population_table))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading population data: {str(e)}")
 
+def parse_bbox(bbox: Optional[str]) -> Optional[List[float]]:
+    """Parse a 'west,south,east,north' query parameter"""
+    if bbox is None:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(','))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be 'west,south,east,north'")
+    if west > east or south > north:
+        raise HTTPException(status_code=400, detail="bbox must satisfy west <= east and south <= north")
+    return [west, south, east, north]
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated 'fields' query parameter"""
+    if fields is None:
+        return None
+    names = sorted({name.strip() for name in fields.split(',') if name.strip()})
+    unknown = [name for name in names if name not in CITY_FIELDS]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"fields must be a comma-separated subset of {', '.join(CITY_FIELDS)}")
+    return names
+
+async def stream_city(request: Request, city: str, lod: int, names: Optional[List[str]]) -> StreamingResponse:
+    """Send the city payload as NDJSON, encoding and compressing one chunk at a time on the blocking pool"""
+    try:
+        # Open the dataset up front so a missing city is still a 404 rather than a broken stream
+        await blocking_pool.run(data_service.load_dataset, city)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Data not found for city '{city}'")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading city data: {str(e)}")
+    
+    encoding = stream_encoding(request)
+    chunks = compress_chunks(data_service.stream_city_ndjson(city, lod=lod, fields=names), encoding)
+    
+    async def body():
+        while True:
+            chunk = await blocking_pool.run(next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                yield chunk
+    
+    headers = {'Vary': 'Accept-Encoding', 'Cache-Control': f"public, max-age={CACHE_MAX_AGE}"}
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return StreamingResponse(body(), media_type="application/x-ndjson", headers=headers)
+
 @app.get("/city/{city}", response_model=CityEmissionData)
-async def get_city_data(city: str):
-    """Get baseline emissions data for a specific city"""
-    if city not in CITIES:
+async def get_city_data(
+    request: Request,
+    city: str,
+    lod: int = Query(0, ge=0, le=MAX_LOD, description="Ward geometry level of detail (0 = full resolution)"),
+    bbox: Optional[str] = Query(None, description="Clip wards and grid to 'west,south,east,north'"),
+    fields: Optional[str] = Query(None, description="Only return these parts: any of grid, roads, stats, bounds"),
+    stream: bool = Query(False, description="Stream the payload as NDJSON sections while it is encoded")
+):
+    """Get baseline emissions data for a specific city
+
+    With `fields`, only the selected parts (plus the city name) are returned and
+    only the data they need is read, e.g. `fields=stats,bounds` skips the ward geometry.
+    With `stream`, the response is NDJSON: stats and bounds first, then grid rows
+    and ward features in chunks (see SimpleDataService.stream_city_ndjson).
+    """
+    if city not in city_registry:
         raise HTTPException(status_code=404, detail=f"City '{city}' not found")
     
+    clip = parse_bbox(bbox)
+    names = parse_fields(fields)
+    if stream:
+        if clip is not None:
+            raise HTTPException(status_code=400, detail="stream cannot be combined with bbox")
+        return await stream_city(request, city, lod, names)
     try:
-        city_data = data_service.load_city_data(city)
-        return city_data
+        if names is not None and clip is not None:
+            def build_fields():
+                parts = data_service.load_city_fields(city, names, lod=lod, bbox=clip)
+                with metrics.phase('serialize'):
+                    return CachedBody(json_bytes(parts))
+            body = await blocking_pool.run(build_fields)
+        elif clip is None:
+            # Payloads come precompressed from process_data.py and are sent from their files, or are
+            # assembled from pre-encoded parts and compressed once per city, LOD and field set;
+            # concurrent requests share one load
+            def build_body():
+                payload_file = data_service.city_payload_file(city, lod) if names is None else None
+                if payload_file is not None:
+                    return FileBody(payload_file)
+                return CachedBody(data_service.load_city_json(city, lod=lod, fields=names))
+            key = ('http', 'city', lod) if names is None else ('http', 'city', lod, tuple(names))
+            body = await blocking_pool.run_once((city, key), data_service.memo, city, key, build_body)
+        else:
+            body = await blocking_pool.run(lambda: CachedBody.from_model(
+                data_service.load_city_view(city, lod=lod, bbox=clip)))
+        return await send_cached(request, body)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Data not found for city '{city}'")
     except Exception as e:
@@ -230,30 +303,367 @@ async def get_city_data(city: str):
 @app.post("/apply_policy", response_model=PolicyResponse)
 async def apply_congestion_pricing(policy_request: PolicyRequest):
     """Apply congestion pricing policy to selected roads and calculate new emissions"""
-    if policy_request.city not in CITIES:
+    metrics.set_city(policy_request.city)
+    if policy_request.city not in city_registry:
         raise HTTPException(status_code=404, detail=f"City '{policy_request.city}' not found")
     
     try:
-        result = data_service.apply_congestion_pricing(
+        result = await blocking_pool.run(
+            data_service.apply_congestion_pricing,
             city=policy_request.city,
             selected_roads=policy_request.selected_roads,
-            pricing_intensity=policy_request.pricing_intensity
+            pricing_intensity=policy_request.pricing_intensity,
+            include_grid=policy_request.include_grid
         )
-        return result
+        return json_response(result)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Data not found for city '{policy_request.city}'")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error applying policy: {str(e)}")
 
+@app.post("/apply_policy/batch", response_model=PolicySweepResponse)
+async def apply_congestion_pricing_batch(sweep_request: PolicySweepRequest):
+    """Evaluate many congestion pricing scenarios for one city in a single request
+
+    Scenarios are the explicit `scenarios` list followed by every combination
+    of the `intensities` range with the `ward_sets`.
+    """
+    metrics.set_city(sweep_request.city)
+    if sweep_request.city not in city_registry:
+        raise HTTPException(status_code=404, detail=f"City '{sweep_request.city}' not found")
+    
+    # intensities and ward_sets only make sense together
+    spec = sweep_request.intensities
+    if (spec is None) != (not sweep_request.ward_sets):
+        raise HTTPException(status_code=400, detail="intensities and ward_sets must be given together")
+    
+    # Reject oversized sweeps before expanding the intensity x ward_sets grid
+    scenario_count = len(sweep_request.scenarios)
+    if spec is not None:
+        scenario_count += spec.num * len(sweep_request.ward_sets)
+    if scenario_count > MAX_SWEEP_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SWEEP_SCENARIOS} scenarios can be evaluated at once")
+    
+    # Deduplicate ward selections so each coverage vector is computed once
+    ward_sets: List[List[int]] = []
+    set_lookup: Dict[tuple, int] = {}
+    def ward_set_id(wards: List[int]) -> int:
+        key = tuple(sorted(set(wards)))
+        if key not in set_lookup:
+            set_lookup[key] = len(ward_sets)
+            ward_sets.append(list(key))
+        return set_lookup[key]
+    
+    set_index = [ward_set_id(s.selected_roads) for s in sweep_request.scenarios]
+    intensities = [s.pricing_intensity for s in sweep_request.scenarios]
+    
+    if spec is not None:
+        step = (spec.stop - spec.start) / (spec.num - 1) if spec.num > 1 else 0.0
+        grid_ids = [ward_set_id(wards) for wards in sweep_request.ward_sets]
+        for set_id in grid_ids:
+            for i in range(spec.num):
+                set_index.append(set_id)
+                intensities.append(spec.start + step * i)
+    
+    if not intensities:
+        raise HTTPException(status_code=400, detail="No scenarios given: provide scenarios or intensities with ward_sets")
+    
+    try:
+        return json_response(await blocking_pool.run(
+            data_service.sweep_congestion_pricing,
+            city=sweep_request.city,
+            ward_sets=ward_sets,
+            set_index=set_index,
+            intensities=intensities
+        ))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Data not found for city '{sweep_request.city}'")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error applying policies: {str(e)}")
+
+@app.post("/optimize_wards", response_model=WardOptimizationResponse)
+async def optimize_wards(optimization_request: WardOptimizationRequest):
+    """Find the fewest wards (or least road length) to price for a reduction target"""
+    metrics.set_city(optimization_request.city)
+    if optimization_request.city not in city_registry:
+        raise HTTPException(status_code=404, detail=f"City '{optimization_request.city}' not found")
+    
+    try:
+        return json_response(await blocking_pool.run(
+            data_service.optimize_wards,
+            city=optimization_request.city,
+            pollutant=optimization_request.pollutant,
+            target_reduction=optimization_request.target_reduction,
+            pricing_intensity=optimization_request.pricing_intensity,
+            objective=optimization_request.objective,
+            method=optimization_request.method
+        ))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Data not found for city '{optimization_request.city}'")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error optimizing wards: {str(e)}")
+
+SESSION_OPS = ('add', 'remove', 'toggle', 'set', 'intensity', 'snapshot')
+
+def _ward_list(message: Dict[str, Any]) -> List[int]:
+    wards = message.get('wards', [])
+    if not isinstance(wards, list) or not all(isinstance(w, int) and not isinstance(w, bool) for w in wards):
+        raise ValueError("wards must be a list of ward indices")
+    return wards
+
+def apply_session_op(city: str, session, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply one client message to a policy session and describe what changed"""
+    op = message.get('op')
+    if op not in SESSION_OPS:
+        raise ValueError(f"op must be one of {', '.join(SESSION_OPS)}")
+    
+    if op == 'snapshot':
+        return {'type': 'snapshot', 'selected': sorted(session.selected),
+                **data_service.policy_session_state(city, session)}
+    
+    before = set(session.selected)
+    changed = set()
+    if op == 'intensity':
+        value = message.get('value')
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 <= value <= 100:
+            raise ValueError("value must be a pricing intensity between 0 and 100")
+        session.set_intensity(float(value))
+        # Every ward scales with the intensity
+        changed = set(session.selected)
+    else:
+        wards = _ward_list(message)
+        if op == 'add':
+            changed = session.update(add=wards)
+        elif op == 'remove':
+            changed = session.update(remove=wards)
+        elif op == 'toggle':
+            changed = session.update(add=[w for w in wards if w not in before],
+                                     remove=[w for w in wards if w in before])
+        else:
+            wanted = set(wards)
+            changed = session.update(add=wanted - before, remove=before - wanted)
+    
+    return {
+        'type': 'delta',
+        'added': sorted(session.selected - before),
+        'removed': sorted(before - session.selected),
+        **data_service.policy_session_state(city, session, changed),
+    }
+
+@app.websocket("/ws/policy/{city}")
+async def policy_session(websocket: WebSocket, city: str,
+                         intensity: float = Query(0.0, ge=0, le=100, description="Initial pricing intensity"),
+                         wards: Optional[str] = Query(None, description="Initially selected wards, comma-separated")):
+    """Interactive congestion pricing: adjust the policy message by message
+    
+    The server sends a snapshot with the full result, then answers every
+    message ({"op": "add" | "remove" | "toggle" | "set", "wards": [...]},
+    {"op": "intensity", "value": 40} or {"op": "snapshot"}) with a delta
+    holding the new totals and the reductions of the wards that changed.
+    Only the cells of the toggled wards are recomputed.
+    """
+    if city not in city_registry:
+        await websocket.close(code=4404, reason=f"City '{city}' not found")
+        return
+    try:
+        selected = [int(w) for w in wards.split(',') if w.strip()] if wards else []
+    except ValueError:
+        await websocket.close(code=4400, reason="wards must be comma-separated ward indices")
+        return
+    
+    await websocket.accept()
+    try:
+        session = await blocking_pool.run(data_service.open_policy_session, city, selected, intensity)
+        snapshot = await blocking_pool.run(data_service.policy_session_state, city, session)
+        baseline_stats = await blocking_pool.run(data_service.get_emission_stats, city)
+    except FileNotFoundError:
+        await websocket.close(code=4404, reason=f"Data not found for city '{city}'")
+        return
+    except ValueError as e:
+        await websocket.close(code=4400, reason=str(e))
+        return
+    except Exception as e:
+        logger.exception("Policy session for %s failed to start", city)
+        await websocket.close(code=1011, reason=f"Error opening policy session: {str(e)}"[:120])
+        return
+    
+    await websocket.send_text(json_bytes({
+        'type': 'snapshot', 'seq': 0, 'city': city, 'baseline_stats': baseline_stats.model_dump(),
+        'selected': sorted(session.selected), **snapshot,
+    }).decode())
+    
+    seq = 0
+    try:
+        while True:
+            text = await websocket.receive_text()
+            seq += 1
+            started = time.perf_counter()
+            try:
+                try:
+                    message = json.loads(text)
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    raise ValueError("messages must be JSON objects")
+                reply = await blocking_pool.run(apply_session_op, city, session, message)
+            except ValueError as e:
+                reply = {'type': 'error', 'detail': str(e)}
+            reply['seq'] = seq
+            reply['elapsed_ms'] = (time.perf_counter() - started) * 1000
+            await websocket.send_text(json_bytes(reply).decode())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.exception("Policy session for %s failed", city)
+        await websocket.close(code=1011, reason=f"Error updating policy session: {str(e)}"[:120])
+
+@app.get("/national/summary")
+async def get_national_summary():
+    """Get national emission totals, per-capita emissions and per-city summaries"""
+    try:
+        return json_response(await blocking_pool.run(national_index.national_summary))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building national summary: {str(e)}")
+
+@app.get("/national/states")
+async def get_state_summaries():
+    """Get emission and population aggregates per state"""
+    try:
+        return json_response(await blocking_pool.run(national_index.state_summaries))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building state summaries: {str(e)}")
+
+@app.post("/national/policy")
+async def apply_national_policy(policy_request: NationalPolicyRequest):
+    """Apply one congestion pricing policy in every city and report national totals"""
+    cities = policy_request.cities
+    if cities is not None:
+        unknown = [city for city in cities if city not in city_registry]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Cities not found: {', '.join(unknown)}")
+        cities = [city for city in cities if (data_service.data_dir / city / "data.json").exists()]
+    
+    try:
+        return json_response(await blocking_pool.run(
+            national_index.apply_policy_everywhere,
+            pricing_intensity=policy_request.pricing_intensity,
+            ward_fraction=policy_request.ward_fraction,
+            cities=cities
+        ))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error applying national policy: {str(e)}")
+
+async def grid_response(city: str, pollutant: str, encoding: str, tile: Optional[List[int]] = None) -> Response:
+    """Binary emission grid response shared by the whole-grid and tile endpoints"""
+    if city not in city_registry:
+        raise HTTPException(status_code=404, detail=f"City '{city}' not found")
+    
+    try:
+        grid_tile = await blocking_pool.run_once((city, 'grid', pollutant, encoding, tuple(tile or ())),
+                                                 data_service.get_grid_tile, city, pollutant, encoding=encoding, tile=tile)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Data not found for city '{city}'")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error encoding grid: {str(e)}")
+    
+    return Response(content=grid_tile.body, media_type="application/octet-stream", headers=grid_tile.headers)
+
+@app.get("/city/{city}/grid/{pollutant}")
+async def get_city_grid(city: str, pollutant: str,
+                        encoding: str = Query("float32", description="float32, float16 or uint8")):
+    """Get a whole emission grid (co2, nox or pm25) as little-endian binary
+
+    Decode with value = raw * X-Grid-Scale + X-Grid-Offset; rows run south to
+    north as in emission_grid, shape is given by X-Grid-Shape.
+    """
+    return await grid_response(city, pollutant, encoding)
+
+@app.get("/city/{city}/grid/{pollutant}/{z}/{x}/{y}")
+async def get_city_grid_tile(city: str, pollutant: str, z: int, x: int, y: int,
+                             encoding: str = Query("float32", description="float32, float16 or uint8")):
+    """Get one tile of an emission grid as little-endian binary
+
+    At zoom z the grid is split into 2^z x 2^z tiles; x counts columns from the
+    west and y counts rows from the south.
+    """
+    return await grid_response(city, pollutant, encoding, tile=[z, x, y])
+
+@app.get("/city/{city}/lookup", response_model=PointLookupResponse)
+async def lookup_point(
+    city: str,
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude")
+):
+    """Ward and grid cell under a point, e.g. for hover tooltips without the full geometry"""
+    if city not in city_registry:
+        raise HTTPException(status_code=404, detail=f"City '{city}' not found")
+    
+    try:
+        return json_response(await blocking_pool.run(data_service.lookup_point, city, lat, lon))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Data not found for city '{city}'")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error looking up point: {str(e)}")
+
+@app.get("/city/{city}/bbox", response_model=BBoxQueryResponse)
+async def query_bbox(
+    city: str,
+    bbox: str = Query(..., description="'west,south,east,north'")
+):
+    """Wards (with their emissions) and grid cell values within a bounding box"""
+    if city not in city_registry:
+        raise HTTPException(status_code=404, detail=f"City '{city}' not found")
+    
+    clip = parse_bbox(bbox)
+    try:
+        return json_response(await blocking_pool.run(data_service.query_bbox, city, clip))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Data not found for city '{city}'")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error querying bbox: {str(e)}")
+
+@app.get("/city/{city}/analytics")
+async def get_city_analytics(
+    request: Request,
+    city: str,
+    k: int = Query(10, ge=1, le=100, description="Number of hotspot cells and top wards"),
+    bins: int = Query(20, ge=1, le=200, description="Histogram bins")
+):
+    """Hotspots, percentiles, histograms and per-ward aggregates of the co2, nox and pm25 grids
+
+    Percentiles and histograms cover the cells with emissions. Ward lists are
+    indexed by ward (road_id); ward totals weight each cell by the share inside the ward.
+    """
+    if city not in city_registry:
+        raise HTTPException(status_code=404, detail=f"City '{city}' not found")
+    
+    # Bodies are memoized per (k, bins) with the city, and weigh against the city cache budget
+    key = ('http', 'analytics', k, bins)
+    try:
+        body = await blocking_pool.run_once((city, key), data_service.memo, city, key, lambda: CachedBody(
+            json_bytes(data_service.get_city_analytics(city, k=k, bins=bins))))
+        return await send_cached(request, body)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Data not found for city '{city}'")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error computing analytics: {str(e)}")
+
 @app.get("/city/{city}/stats", response_model=EmissionStats)
-async def get_city_stats(city: str):
+async def get_city_stats(request: Request, city: str):
     """Get emission statistics for a city"""
-    if city not in CITIES:
+    if city not in city_registry:
         raise HTTPException(status_code=404, detail=f"City '{city}' not found")
     
     try:
-        stats = data_service.get_emission_stats(city)
-        return stats
+        body = await blocking_pool.run_once((city, ('http', 'stats')), data_service.memo, city, ('http', 'stats'),
+                                            lambda: CachedBody.from_model(data_service.get_emission_stats(city)))
+        return await send_cached(request, body)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Data not found for city '{city}'")
     except Exception as e:
@@ -0,0 +1,158 @@
+# Request metrics: per-phase timers, histograms and the Prometheus text format
+#
+# A request gets a RequestMetrics in a context variable; code anywhere below the
+# handler wraps its work in `with phase('name'):` and the time is added to the
+# request's breakdown. When the response is ready the middleware records the
+# request and its phases into histograms labelled by endpoint and city.
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their phase breakdown (0 disables the log)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class RequestMetrics:
+    """Labels and phase timings of the request being handled"""
+
+    def __init__(self, endpoint: str = "", city: str = ""):
+        self.endpoint = endpoint
+        self.city = city
+        self.phases: Dict[str, float] = {}
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar('request_metrics', default=None)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+def set_city(city: str) -> None:
+    """Label the current request with a city (for endpoints that take it from the body)"""
+    request = _current.get()
+    if request is not None:
+        request.city = city
+
+
+@contextmanager
+def phase(name: str):
+    """Add the time spent in the block to phase `name` of the current request"""
+    request = _current.get()
+    if request is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.phases[name] = request.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _format_labels(self.label_names, labels)
+            prefix = base + "," if base else ""
+            suffix = f"{{{base}}}" if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{{{prefix}le=\"{bound:g}\"}} {count}")
+            lines.append(f"{self.name}_bucket{{{prefix}le=\"+Inf\"}} {series[-2]}")
+            lines.append(f"{self.name}_sum{suffix} {series[-1]!r}")
+            lines.append(f"{self.name}_count{suffix} {series[-2]}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+
+
+class MetricsRegistry:
+    """Request, phase and payload size histograms plus gauges collected at scrape time"""
+
+    def __init__(self):
+        self.requests = Histogram('http_request_duration_seconds', "Request latency",
+                                  ('endpoint', 'city', 'status'), LATENCY_BUCKETS)
+        self.phases = Histogram('http_request_phase_seconds', "Time spent in each phase of a request",
+                                ('endpoint', 'city', 'phase'), LATENCY_BUCKETS)
+        self.sizes = Histogram('http_response_size_bytes', "Response body size as sent",
+                               ('endpoint', 'city'), SIZE_BUCKETS)
+        self._gauges: List[Callable[[], List[str]]] = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, collect: Callable[[], List[str]]) -> None:
+        """Register a function returning exposition lines, called on every scrape"""
+        self._gauges.append(collect)
+
+    def record(self, request: RequestMetrics, status: int, duration: float, size: Optional[int]) -> None:
+        with self._lock:
+            self.requests.observe((request.endpoint, request.city, str(status)), duration)
+            for name, seconds in request.phases.items():
+                self.phases.observe((request.endpoint, request.city, name), seconds)
+            if size is not None:
+                self.sizes.observe((request.endpoint, request.city), size)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = self.requests.render() + self.phases.render() + self.sizes.render()
+        for collect in self._gauges:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, help_text: str, value: float, metric_type: str = "gauge") -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {value!r}"]
+
+
+def log_if_slow(method: str, path: str, request: RequestMetrics, status: int, duration: float) -> None:
+    if not SLOW_REQUEST_MS or duration * 1000 < SLOW_REQUEST_MS:
+        return
+    breakdown = ", ".join(f"{name} {seconds * 1000:.1f} ms"
+                          for name, seconds in sorted(request.phases.items(), key=lambda item: -item[1]))
+    logger.warning("Slow request %s %s (%s) -> %d in %.1f ms: %s", method, path, request.city or "-",
+                   status, duration * 1000, breakdown or "no phases recorded")
+
+
+@contextmanager
+def track_request(endpoint: str = "", city: str = ""):
+    """Make a RequestMetrics current for the duration of the block"""
+    request = RequestMetrics(endpoint, city)
+    token = _current.set(request)
+    try:
+        yield request
+    finally:
+        _current.reset(token)
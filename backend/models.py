@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from datetime import datetime
 
 class EmissionStats(BaseModel):
@@ -29,6 +29,7 @@ class PolicyRequest(BaseModel):
     city: str = Field(..., description="Target city")
     selected_roads: List[int] = Field(..., description="List of selected road feature indices")
     pricing_intensity: float = Field(..., ge=0, le=100, description="Pricing intensity percentage (0-100)")
+    include_grid: bool = Field(default=False, description="Include the projected emission grids in the response")
 
 class PolicyResponse(BaseModel):
     """Response after applying congestion pricing policy"""
@@ -39,6 +40,67 @@ class PolicyResponse(BaseModel):
     affected_roads: List[int] = Field(..., description="List of affected road indices")
     pricing_intensity: float = Field(..., description="Applied pricing intensity")
     estimated_cost_savings: float = Field(..., description="Estimated cost savings in USD")
+    ward_reductions: Dict[int, EmissionStats] = Field(default_factory=dict, description="Emission reduction in tons attributed to each selected ward")
+    projected_grid: Optional[Dict[str, List[List[float]]]] = Field(default=None, description="Projected emission grid per pollutant (only when include_grid is set)")
+
+class PolicyScenario(BaseModel):
+    """A single congestion pricing scenario within a sweep"""
+    selected_roads: List[int] = Field(..., description="List of selected road feature indices")
+    pricing_intensity: float = Field(..., ge=0, le=100, description="Pricing intensity percentage (0-100)")
+
+class IntensityRange(BaseModel):
+    """Evenly spaced pricing intensities, endpoints included"""
+    start: float = Field(..., ge=0, le=100, description="First pricing intensity")
+    stop: float = Field(..., ge=0, le=100, description="Last pricing intensity")
+    num: int = Field(..., ge=1, le=1000, description="Number of intensities")
+
+class PolicySweepRequest(BaseModel):
+    """Request to evaluate many congestion pricing scenarios for one city"""
+    city: str = Field(..., description="Target city")
+    scenarios: List[PolicyScenario] = Field(default_factory=list, description="Explicit scenarios")
+    intensities: Optional[IntensityRange] = Field(default=None, description="Intensity range crossed with ward_sets")
+    ward_sets: List[List[int]] = Field(default_factory=list, description="Ward selections crossed with intensities")
+
+class PolicySweepResponse(BaseModel):
+    """Columnar results of a policy sweep, one entry per scenario in every list"""
+    city: str = Field(..., description="City name")
+    baseline_stats: EmissionStats = Field(..., description="Baseline emission statistics")
+    scenario_count: int = Field(..., description="Number of evaluated scenarios")
+    ward_sets: List[List[int]] = Field(..., description="Distinct ward selections referenced by ward_set_index")
+    ward_set_index: List[int] = Field(..., description="Ward selection of each scenario")
+    pricing_intensity: List[float] = Field(..., description="Pricing intensity of each scenario")
+    projected: Dict[str, List[float]] = Field(..., description="Projected emissions in tons by pollutant")
+    reduction_percentage: Dict[str, List[float]] = Field(..., description="Percentage reduction by pollutant")
+    estimated_cost_savings: List[float] = Field(..., description="Estimated cost savings in USD")
+
+class WardOptimizationRequest(BaseModel):
+    """Reduction target for which the wards to price are chosen"""
+    city: str = Field(..., description="Target city")
+    pollutant: Literal['co2', 'nox', 'pm25', 'total'] = Field(default='co2', description="Pollutant the target applies to")
+    target_reduction: float = Field(..., gt=0, le=100, description="Target reduction in percent of the baseline")
+    pricing_intensity: float = Field(default=100, gt=0, le=100, description="Pricing intensity percentage (0-100)")
+    objective: Literal['wards', 'road_length'] = Field(default='wards', description="Minimise the number of wards or the priced road length")
+    method: Literal['greedy', 'exact'] = Field(default='greedy', description="Greedy search, or exact knapsack (small cities)")
+
+class WardOptimizationResponse(BaseModel):
+    """Ward selection for a reduction target and the policy it results in"""
+    city: str = Field(..., description="City name")
+    pollutant: str = Field(..., description="Pollutant the target applies to")
+    target_reduction: float = Field(..., description="Target reduction in percent of the baseline")
+    objective: str = Field(..., description="Minimised cost")
+    method: str = Field(..., description="Search method used")
+    selected_roads: List[int] = Field(..., description="Selected ward feature indices, in order of selection")
+    ward_count: int = Field(..., description="Number of selected wards")
+    road_length_km: float = Field(..., description="Approximate road length in the selected wards (km)")
+    achieved_reduction: float = Field(..., description="Reduction reached in percent of the baseline")
+    target_met: bool = Field(..., description="Whether the target is reached (false: every ward helping is selected)")
+    policy: PolicyResponse = Field(..., description="Outcome of pricing the selected wards")
+
+class NationalPolicyRequest(BaseModel):
+    """Request to apply one congestion pricing policy in every city"""
+    pricing_intensity: float = Field(..., ge=0, le=100, description="Pricing intensity percentage (0-100)")
+    ward_fraction: float = Field(default=1.0, gt=0, le=1, description="Fraction of each city's wards priced, highest CO2 first")
+    cities: Optional[List[str]] = Field(default=None, description="Restrict to these cities (default: all)")
 
 class EmissionPoint(BaseModel):
     """Single emission data point"""
@@ -47,3 +109,31 @@ class EmissionPoint(BaseModel):
     co2: float = Field(..., description="CO2 emission value")
     nox: float = Field(..., description="NOx emission value")
     pm25: float = Field(..., description="PM2.5 emission value")
+
+class GridCell(EmissionPoint):
+    """Emission grid cell, located by its centre"""
+    row: int = Field(..., description="Row in emission_grid")
+    col: int = Field(..., description="Column in emission_grid")
+
+class WardSummary(BaseModel):
+    """Ward with the emissions inside its boundary"""
+    ward: int = Field(..., description="Ward feature index (road_id)")
+    ward_number: Any = Field(..., description="Ward number from the source data")
+    name: str = Field(..., description="Ward name")
+    emissions: EmissionStats = Field(..., description="Emissions in tons within the ward, weighted by cell overlap")
+
+class PointLookupResponse(BaseModel):
+    """Ward and grid cell under a point"""
+    city: str = Field(..., description="City name")
+    lat: float = Field(..., description="Queried latitude")
+    lon: float = Field(..., description="Queried longitude")
+    ward: Optional[WardSummary] = Field(default=None, description="Ward containing the point, if any")
+    cell: Optional[GridCell] = Field(default=None, description="Grid cell containing the point, if inside the grid")
+
+class BBoxQueryResponse(BaseModel):
+    """Wards and grid cells within a bounding box"""
+    city: str = Field(..., description="City name")
+    bbox: List[float] = Field(..., description="Queried west, south, east, north")
+    wards: List[WardSummary] = Field(..., description="Wards whose bounding box intersects the query")
+    coordinates: Dict[str, List[float]] = Field(..., description="Latitudes and longitudes of the returned cells")
+    grids: Dict[str, List[List[float]]] = Field(..., description="Cell values per pollutant, rows by latitude")
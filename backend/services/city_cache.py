@@ -0,0 +1,169 @@
+# City data cache
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class CityDataCache:
+    """Bounded LRU cache of parsed city data, invalidated when the source file changes
+
+    Loads are single-flight: threads that miss on a key another thread is
+    already loading (for the same file version) wait for that load instead
+    of starting their own.
+
+    Values with a memory_bytes() method (city datasets) are weighted by what
+    they currently hold, so memoized artifacts derived after loading count
+    against max_bytes; other values weigh their on-disk size.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: Optional[int] = None, verify_hash: bool = False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.verify_hash = verify_hash
+
+        # key -> (fingerprint, size_bytes, value); size_bytes is None for values weighed by memory_bytes()
+        self._entries: "OrderedDict[str, Tuple[Tuple, Optional[int], Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        # key -> (fingerprint, future) of loads in progress
+        self._loading: Dict[str, Tuple[Tuple, Future]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.coalesced = 0
+
+    def _fingerprint(self, path: Path) -> Tuple:
+        """Identify a file version by mtime and size, optionally by content hash"""
+        stat = path.stat()
+        if not self.verify_hash:
+            return (stat.st_mtime_ns, stat.st_size)
+
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+    def get(self, key: str, path: Path, loader: Callable[[], Any], size: Optional[int] = None) -> Any:
+        """Return the cached value for key, calling loader() on a miss or when path has changed"""
+        fingerprint = self._fingerprint(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == fingerprint:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    # Derived artifacts grow entries after they are loaded
+                    self._evict()
+                    return entry[2]
+                # Source file changed since it was cached
+                self._remove(key)
+                self.invalidations += 1
+
+            loading = self._loading.get(key)
+            if loading is not None and loading[0] == fingerprint:
+                self.coalesced += 1
+                future = loading[1]
+                owner = False
+            else:
+                self.misses += 1
+                future = Future()
+                self._loading[key] = (fingerprint, future)
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._finish_loading(key, future)
+            future.set_exception(e)
+            raise
+
+        # Without a memory estimate, the on-disk size is used as the weight of an entry
+        if size is None and not hasattr(value, 'memory_bytes'):
+            size = fingerprint[1]
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (fingerprint, size, value)
+            self._evict()
+            self._finish_loading(key, future)
+
+        future.set_result(value)
+        return value
+
+    def _finish_loading(self, key: str, future: Future) -> None:
+        if self._loading.get(key, (None, None))[1] is future:
+            del self._loading[key]
+
+    def _remove(self, key: str) -> None:
+        del self._entries[key]
+
+    @staticmethod
+    def _weight(entry: Tuple[Tuple, Optional[int], Any]) -> int:
+        _, size, value = entry
+        return value.memory_bytes() if size is None else size
+
+    def _total_bytes(self) -> int:
+        return sum(self._weight(entry) for entry in self._entries.values())
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is within budget"""
+        total = self._total_bytes() if self.max_bytes is not None else 0
+        # Always keep the most recent entry, even if it alone exceeds the byte budget
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            oldest = next(iter(self._entries))
+            total -= self._weight(self._entries[oldest])
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one entry, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._total_bytes(),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'coalesced': self.coalesced,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'cities': list(self._entries.keys()),
+            }
+
+    @classmethod
+    def from_env(cls) -> 'CityDataCache':
+        """Build a cache sized from CITY_CACHE_* environment variables"""
+        max_bytes = os.environ.get('CITY_CACHE_MAX_BYTES')
+        return cls(
+            max_entries=int(os.environ.get('CITY_CACHE_MAX_ENTRIES', 32)),
+            max_bytes=int(max_bytes) if max_bytes else None,
+            verify_hash=os.environ.get('CITY_CACHE_VERIFY_HASH', '').lower() in ('1', 'true', 'yes'),
+        )
@@ -0,0 +1,205 @@
+# Parsed city dataset
+import mmap
+import sys
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from services import compiled_format
+from services.json_sections import JsonSectionReader, SECTIONS_FILENAME
+
+# Pollutant keys used in API responses, mapped to the grid names in data.json
+POLLUTANT_GRIDS = {
+    'co2': 'co2_total',
+    'nox': 'nox_total',
+    'pm25': 'pm25_total',
+}
+
+
+def footprint(value: Any) -> int:
+    """Approximate heap bytes held by a derived value
+
+    Arrays backed by a memory-mapped file count as nothing, since their pages
+    belong to the page cache and are shared between workers.
+    """
+    if isinstance(value, np.ndarray):
+        base = value
+        while base is not None:
+            if isinstance(base, (np.memmap, mmap.mmap)):
+                return 0
+            base = getattr(base, 'base', None)
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(footprint(k) + footprint(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(footprint(item) for item in value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + footprint(vars(value))
+    return sys.getsizeof(value)
+
+
+def open_city_reader(data_dir: Path, city: str, source: Path, compile_stale: bool = False):
+    """Section reader for a city: the compiled format when up to date, else data.json by offset
+
+    With compile_stale, missing or outdated compiled data is built first, so the
+    grids are memory-mapped rather than parsed (unless the directory is read-only).
+    """
+    out_dir = compiled_format.compiled_dir(data_dir, city)
+    reader = compiled_format.open_reader(source, out_dir)
+    if reader is None and compile_stale:
+        try:
+            compiled_format.ensure_compiled(source, out_dir)
+            # Pin whichever build is current now; a concurrent rebuild may already have replaced ours
+            reader = compiled_format.open_reader(source, out_dir)
+        except OSError:
+            pass
+    if reader is not None:
+        return reader
+    return JsonSectionReader(source, out_dir / SECTIONS_FILENAME)
+
+
+class CityDataset:
+    """Sections, arrays and response model of one city, shared by every endpoint
+
+    Sections are read on first access, so endpoints that only need the summary
+    never parse the grids or the ward geometry.
+    """
+
+    def __init__(self, city: str, source: Path, reader, build_data: Callable[['CityDataset'], Any]):
+        self.city = city
+        self.source = source
+        stat = source.stat()
+        self.source_stat = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+        self._reader = reader
+        self._build_data = build_data
+
+        # Memoized sections and artifacts derived from this dataset (dropped with it on eviction)
+        self.derived: Dict[Any, Any] = {}
+        # key -> footprint of the value, None for values that report a live nbytes
+        self._footprints: Dict[Any, Optional[int]] = {}
+        self._lock = threading.Lock()
+        # key -> future of computes in progress
+        self._computing: Dict[Any, Future] = {}
+
+    def memo(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """Return a derived artifact, computing it once
+
+        Computes are single-flight per key: a thread asking for a key that is
+        being computed waits for that result, while other keys compute in parallel.
+        """
+        if key in self.derived:
+            return self.derived[key]
+        with self._lock:
+            if key in self.derived:
+                return self.derived[key]
+            future = self._computing.get(key)
+            owner = future is None
+            if owner:
+                future = self._computing[key] = Future()
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._computing[key]
+            future.set_exception(e)
+            raise
+
+        # Values exposing nbytes (e.g. response bodies with lazily compressed
+        # variants) may grow, so they are measured whenever the size is asked for
+        size = None if hasattr(value, 'nbytes') and not isinstance(value, np.ndarray) else footprint(value)
+        with self._lock:
+            self.derived[key] = value
+            self._footprints[key] = size
+            del self._computing[key]
+        future.set_result(value)
+        return value
+
+    def memory_bytes(self) -> int:
+        """Approximate heap bytes held by the memoized sections and derived artifacts"""
+        with self._lock:
+            entries = [(self.derived[key], size) for key, size in self._footprints.items()]
+        return sum(int(value.nbytes) if size is None else size for value, size in entries)
+
+    def section(self, path: str) -> Any:
+        """A section of the source data, e.g. 'emissions.summary' or 'geometry'"""
+        return self.memo(('section', path), lambda: self._reader.read(path))
+
+    @property
+    def compiled_dir(self) -> Optional[Path]:
+        """Directory of the up-to-date compiled data, or None when reading data.json"""
+        if isinstance(self._reader, compiled_format.CompiledReader):
+            return self._reader.out_dir
+        return None
+
+    @property
+    def manifest(self) -> Optional[Dict[str, Any]]:
+        """Manifest of the compiled data, or None when reading data.json"""
+        if isinstance(self._reader, compiled_format.CompiledReader):
+            return self._reader.manifest
+        return None
+
+    def loaded_sections(self) -> List[str]:
+        return [key[1] for key in list(self.derived) if isinstance(key, tuple) and key[0] == 'section']
+
+    @property
+    def summary(self) -> Dict[str, Any]:
+        return self.section('emissions.summary')
+
+    @property
+    def static_info(self) -> Dict[str, Any]:
+        return self.section('static_info') if self._reader.has('static_info') else {}
+
+    @property
+    def lat(self) -> np.ndarray:
+        return self.memo('lat', lambda: np.asarray(self.section('emissions.coordinates')['lat'], dtype=np.float64))
+
+    @property
+    def lon(self) -> np.ndarray:
+        return self.memo('lon', lambda: np.asarray(self.section('emissions.coordinates')['lon'], dtype=np.float64))
+
+    @property
+    def grids(self) -> Dict[str, np.ndarray]:
+        return self.memo('grids', lambda: {
+            key: np.asarray(self.section('emissions.emissions')[name]) for key, name in POLLUTANT_GRIDS.items()
+        })
+
+    @property
+    def grid_matrix(self) -> np.ndarray:
+        """Emission grids as one (cells x pollutants) float64 matrix, columns in POLLUTANT_GRIDS order
+
+        Compiled data stores the matrix, so it is memory-mapped rather than copied.
+        """
+        if self._reader.has('emissions.matrix'):
+            return self.section('emissions.matrix')
+        return self.memo('grid_matrix', lambda: np.stack(
+            [np.asarray(self.grids[key], dtype=np.float64).ravel() for key in POLLUTANT_GRIDS], axis=1))
+
+    @property
+    def grid_shape(self):
+        return self.grids['co2'].shape
+
+    @property
+    def features(self) -> List[Dict[str, Any]]:
+        return self.section('geometry').get('features', [])
+
+    @property
+    def feature_count(self) -> int:
+        if ('section', 'geometry') not in self.derived and self._reader.has('geometry.feature_count'):
+            return self.section('geometry.feature_count')
+        return len(self.features)
+
+    @property
+    def data(self):
+        """Complete CityEmissionData response model"""
+        return self.memo('data', lambda: self._build_data(self))
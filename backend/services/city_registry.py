@@ -0,0 +1,140 @@
+# City registry: the cities that have data, with the map rows of every known city
+#
+# Built by scanning data/ for <city>/data.json and joining
+#   data/others/city_coordinates.json   map position of each city (also the listing order)
+#   data/others/df_static.csv           population and state
+# The result is stored in data/others/city_registry.json (by process_data.py or
+# on first start) and reused while the data directory and both files are unchanged.
+import csv
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REGISTRY_VERSION = 3
+REGISTRY_FILENAME = "city_registry.json"
+COORDINATES_FILENAME = "city_coordinates.json"
+POPULATION_FILENAME = "df_static.csv"
+
+
+def _stat(path: Path) -> Optional[List[int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _fingerprint(data_dir: Path) -> Dict[str, Any]:
+    """mtime/size of the inputs; the data directory mtime changes when a city is added or removed"""
+    others = data_dir / "others"
+    return {
+        'data_dir': _stat(data_dir),
+        'coordinates': _stat(others / COORDINATES_FILENAME),
+        'population': _stat(others / POPULATION_FILENAME),
+    }
+
+
+def _read_population(csv_path: Path) -> Dict[str, Dict[str, Any]]:
+    """Population and state per lowercase city name from df_static.csv"""
+    rows = {}
+    with open(csv_path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            rows[row['city'].lower()] = {
+                'display_name': row['city'].title(),
+                'population': int(float(row['population_2020'])),
+                'state': row['state'],
+            }
+    return rows
+
+
+class CityRegistry:
+    """Available cities and the ready-to-serve population table of the India map"""
+
+    def __init__(self, cities: List[str], population_table: List[Dict[str, Any]]):
+        self.cities = cities
+        self.population_table = population_table
+        self._names = set(cities)
+
+    def __contains__(self, city: str) -> bool:
+        return city in self._names
+
+    def __len__(self) -> int:
+        return len(self.cities)
+
+    @classmethod
+    def scan(cls, data_dir: Path) -> 'CityRegistry':
+        """Build the registry from the files in data/"""
+        data_dir = Path(data_dir)
+        others = data_dir / "others"
+
+        coordinates: Dict[str, List[float]] = {}
+        coordinates_file = others / COORDINATES_FILENAME
+        if coordinates_file.exists():
+            with open(coordinates_file, 'r') as f:
+                coordinates = json.load(f)
+
+        population_file = others / POPULATION_FILENAME
+        population = _read_population(population_file) if population_file.exists() else {}
+
+        available = sorted(
+            entry.name for entry in os.scandir(data_dir)
+            if entry.is_dir() and (Path(entry.path) / "data.json").exists()
+        )
+        # Cities with known coordinates keep their listed order, new ones follow alphabetically
+        found = set(available)
+        cities = [city for city in coordinates if city in found]
+        cities += [city for city in available if city not in coordinates]
+
+        # Rows follow df_static.csv; listed cities whose data is missing are kept but flagged
+        population_table = []
+        for city, row in population.items():
+            coords = coordinates.get(city)
+            if coords is None:
+                continue
+            population_table.append({
+                "name": city,
+                "display_name": row['display_name'],
+                "population": row['population'],
+                "state": row['state'],
+                "coordinates": coords,
+                "lat": coords[0],
+                "lng": coords[1],
+                "has_data": city in found
+            })
+
+        return cls(cities, population_table)
+
+    @classmethod
+    def load(cls, data_dir: Path, registry_file: Optional[Path] = None) -> 'CityRegistry':
+        """Registry from the prebuilt file when it is current, otherwise scanned and stored"""
+        data_dir = Path(data_dir)
+        registry_file = Path(registry_file) if registry_file else data_dir / "others" / REGISTRY_FILENAME
+        fingerprint = _fingerprint(data_dir)
+
+        try:
+            with open(registry_file, 'r') as f:
+                stored = json.load(f)
+            if stored.get('version') == REGISTRY_VERSION and stored.get('source') == fingerprint:
+                return cls(stored['cities'], stored['population_table'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        registry = cls.scan(data_dir)
+        try:
+            registry.save(registry_file, fingerprint)
+        except OSError:
+            # Read-only data directory, rescan on every start
+            pass
+        return registry
+
+    def save(self, registry_file: Path, fingerprint: Dict[str, Any]) -> None:
+        tmp_file = registry_file.with_name(registry_file.name + ".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                'version': REGISTRY_VERSION,
+                'source': fingerprint,
+                'cities': self.cities,
+                'population_table': self.population_table,
+            }, f)
+        os.replace(tmp_file, registry_file)
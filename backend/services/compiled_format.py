@@ -0,0 +1,287 @@
+# Compiled city data format
+#
+# A compiled city lives next to its source file:
+#
+#   data/<city>/compiled -> compiled.v<suffix>/
+#       manifest.json      format version, source fingerprint, summary and static info
+#       lat.npy, lon.npy   grid axes (float64)
+#       co2_total.npy      emission grids, one per pollutant (float32 or float64)
+#       nox_total.npy
+#       pm25_total.npy
+#       grid_matrix.npy    the three grids as one (cells x pollutants) float64 matrix, for policy math
+#       geometry.json      ward GeoJSON FeatureCollection
+#       roads_lod<n>.json  ward features as encoded in API responses, written on first use,
+#                          with the byte offset of each feature in roads_lod<n>.offsets.npy
+#
+# process_data.py adds the derived artifacts listed under 'artifacts' in the
+# manifest (LOD geometry, ward overlap, /city payloads with .br/.gz variants),
+# tagged with ARTIFACTS_VERSION so output of an older build is not served.
+#
+# Each build goes into a new compiled.v<suffix>/ directory and 'compiled' is a
+# symlink swapped atomically onto it, so the path always names a complete
+# build. Readers pin the build they opened; the previous build is kept until
+# the next one is published, for readers still using it.
+#
+# Grids and axes are plain .npy files so they can be memory-mapped instead of parsed.
+# With COMPILED_DIR set (e.g. a directory on /dev/shm) the artifacts live in
+# COMPILED_DIR/<city>/ instead, and every worker process maps the same pages.
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from metrics import phase
+
+try:
+    import fcntl
+except ImportError:  # no file locks on Windows, concurrent builds just race
+    fcntl = None
+
+COMPILED_VERSION = 2
+COMPILED_DIRNAME = "compiled"
+
+# Version of the derived artifacts written by process_data.py, bump when their content changes
+ARTIFACTS_VERSION = 2
+POLLUTANTS = ('co2_total', 'nox_total', 'pm25_total')
+
+# Root for compiled artifacts shared by all workers; data/<city>/compiled/ when unset
+COMPILED_ROOT = os.environ.get('COMPILED_DIR')
+
+
+def compiled_dir(data_dir: Path, city: str) -> Path:
+    """Directory holding the compiled artifacts of a city"""
+    if COMPILED_ROOT:
+        return Path(COMPILED_ROOT) / city
+    return Path(data_dir) / city / COMPILED_DIRNAME
+
+
+def file_sha1(path: Path) -> str:
+    """SHA-1 of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(source: Path) -> Dict[str, Any]:
+    """Fingerprint of a data.json used to detect stale compiled output"""
+    stat = source.stat()
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha1': file_sha1(source),
+    }
+
+
+def read_manifest(out_dir: Path) -> Optional[Dict[str, Any]]:
+    """Read a compiled manifest, or None if it is missing or from another format version"""
+    manifest_file = Path(out_dir) / "manifest.json"
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != COMPILED_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(out_dir: Path, manifest: Dict[str, Any]) -> None:
+    write_artifact(Path(out_dir) / "manifest.json", json.dumps(manifest, indent=2).encode())
+
+
+def payload_filename(lod: int) -> str:
+    """Precompressed /city payload of a level of detail"""
+    return f"city_lod{lod}.json"
+
+
+def artifacts_current(out_dir: Path, manifest: Dict[str, Any]) -> bool:
+    """Whether the derived artifacts recorded in the manifest are from this version and all present"""
+    artifacts = manifest.get('artifacts') or {}
+    if artifacts.get('version') != ARTIFACTS_VERSION:
+        return False
+    return all((Path(out_dir) / name).exists() for name in artifacts.get('files', {}))
+
+
+def is_fresh(source: Path, out_dir: Path, manifest: Optional[Dict[str, Any]] = None) -> bool:
+    """Check that the compiled output was built from the current source file"""
+    if manifest is None:
+        manifest = read_manifest(out_dir)
+    if manifest is None or not source.exists():
+        return False
+
+    recorded = manifest['source']
+    stat = source.stat()
+    if stat.st_size != recorded['size']:
+        return False
+    if stat.st_mtime_ns == recorded['mtime_ns']:
+        return True
+    # mtime changes on checkout/copy, fall back to comparing contents
+    return file_sha1(source) == recorded['sha1']
+
+
+def compile_city(source: Path, out_dir: Path, dtype: str = 'float64') -> Dict[str, Any]:
+    """Compile a city's data.json into memory-mappable grids plus a geometry blob"""
+    source = Path(source)
+    out_dir = Path(out_dir)
+    fingerprint = source_fingerprint(source)
+
+    with open(source, 'r') as f:
+        data = json.load(f)
+
+    emissions = data['emissions']
+
+    # Write into a new build directory and publish it when complete, so readers never see a partial build
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=out_dir.name + ".v", dir=out_dir.parent))
+    tmp_dir.chmod(0o755)
+
+    np.save(tmp_dir / "lat.npy", np.asarray(emissions['coordinates']['lat'], dtype=np.float64))
+    np.save(tmp_dir / "lon.npy", np.asarray(emissions['coordinates']['lon'], dtype=np.float64))
+    for pollutant in POLLUTANTS:
+        np.save(tmp_dir / f"{pollutant}.npy", np.asarray(emissions['emissions'][pollutant], dtype=dtype))
+    np.save(tmp_dir / "grid_matrix.npy", np.stack(
+        [np.asarray(emissions['emissions'][pollutant], dtype=np.float64).ravel() for pollutant in POLLUTANTS], axis=1))
+
+    with open(tmp_dir / "geometry.json", 'w') as f:
+        json.dump(data['geometry'], f, separators=(',', ':'))
+
+    manifest = {
+        'version': COMPILED_VERSION,
+        'city': data.get('city', source.parent.name),
+        'dtype': np.dtype(dtype).name,
+        'grid_shape': list(np.shape(emissions['emissions'][POLLUTANTS[0]])),
+        'source': fingerprint,
+        'summary': emissions['summary'],
+        'static_info': data.get('static_info', {}),
+        'metadata': data.get('metadata', {}),
+        'feature_count': len(data['geometry'].get('features', [])),
+    }
+    write_manifest(tmp_dir, manifest)
+
+    _publish(tmp_dir, out_dir)
+    return manifest
+
+
+def current_build(out_dir: Path) -> Path:
+    """Build directory out_dir points at right now"""
+    return Path(os.path.realpath(out_dir))
+
+
+def _publish(build_dir: Path, out_dir: Path) -> None:
+    """Point out_dir at a finished build with an atomic symlink swap, then drop older builds
+
+    Called with the build lock held, so no other build is in progress.
+    """
+    previous = current_build(out_dir) if out_dir.is_symlink() else None
+    if out_dir.exists() and not out_dir.is_symlink():
+        # A plain directory from before versioned builds: move it aside for the link
+        previous = out_dir.with_name(out_dir.name + ".v-legacy")
+        if previous.exists():
+            shutil.rmtree(previous)
+        os.replace(out_dir, previous)
+
+    link = out_dir.with_name(out_dir.name + f".link{os.getpid()}")
+    if link.is_symlink():
+        link.unlink()
+    os.symlink(build_dir.name, link)
+    os.replace(link, out_dir)
+
+    for old in out_dir.parent.glob(out_dir.name + ".v*"):
+        if old.is_dir() and not old.is_symlink() and old not in (build_dir, previous):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+@contextmanager
+def build_lock(out_dir: Path):
+    """Exclusive lock held while one process builds a city's compiled output"""
+    out_dir = Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_dir.with_name(out_dir.name + ".lock"), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def ensure_compiled(source: Path, out_dir: Path) -> Dict[str, Any]:
+    """Manifest of up-to-date compiled output, compiling it first if needed
+
+    Worker processes starting together take a file lock, so the city is
+    compiled once and the others map the result.
+    """
+    with build_lock(out_dir):
+        manifest = read_manifest(out_dir)
+        if manifest is not None and is_fresh(source, out_dir, manifest):
+            return manifest
+        dtype = manifest['dtype'] if manifest is not None else 'float64'
+        return compile_city(source, out_dir, dtype=dtype)
+
+
+def open_reader(source: Path, out_dir: Path) -> Optional['CompiledReader']:
+    """Reader pinned to the current build of out_dir, or None when it is missing or stale"""
+    build = current_build(out_dir)
+    manifest = read_manifest(build)
+    if manifest is None or not is_fresh(source, build, manifest):
+        return None
+    return CompiledReader(build, manifest)
+
+
+def write_artifact(path: Path, data: bytes) -> None:
+    """Write a file next to the compiled data atomically, so readers never see it half written"""
+    tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+class CompiledReader:
+    """Reads sections of a compiled city, using data.json section names
+
+    Memory-mapped arrays are opened up front: the mappings stay valid when a
+    newer build replaces this one, so grids always match the manifest.
+    """
+
+    def __init__(self, out_dir: Path, manifest: Dict[str, Any], mmap: bool = True):
+        self.out_dir = Path(out_dir)
+        self.manifest = manifest
+        self.mmap_mode = 'r' if mmap else None
+        self._mapped: Dict[str, np.ndarray] = {}
+        if mmap:
+            self._mapped = {name: self._load(name) for name in ('lat', 'lon', 'grid_matrix') + POLLUTANTS}
+
+    def _load(self, name: str) -> np.ndarray:
+        if name in self._mapped:
+            return self._mapped[name]
+        with phase('file_read'):
+            return np.load(self.out_dir / f"{name}.npy", mmap_mode=self.mmap_mode)
+
+    def has(self, path: str) -> bool:
+        return path in ('static_info', 'metadata', 'emissions.summary', 'emissions.coordinates',
+                        'emissions.emissions', 'emissions.matrix', 'geometry', 'geometry.feature_count')
+
+    def read(self, path: str) -> Any:
+        """Value of a section such as 'static_info' or 'emissions.summary'"""
+        if path in ('static_info', 'metadata'):
+            return self.manifest[path]
+        if path == 'emissions.summary':
+            return self.manifest['summary']
+        if path == 'geometry.feature_count':
+            return self.manifest['feature_count']
+        if path == 'emissions.coordinates':
+            return {'lat': self._load("lat"), 'lon': self._load("lon")}
+        if path == 'emissions.emissions':
+            return {pollutant: self._load(pollutant) for pollutant in POLLUTANTS}
+        if path == 'emissions.matrix':
+            return self._load("grid_matrix")
+        if path == 'geometry':
+            with phase('file_read'), open(self.out_dir / "geometry.json", 'rb') as f:
+                raw = f.read()
+            with phase('json_parse'):
+                return json.loads(raw)
+        raise KeyError(path)
@@ -0,0 +1,265 @@
+# Level-of-detail ward geometry
+#
+# Ward rings are split into arcs at junctions (vertices where the neighbouring
+# rings diverge, as in TopoJSON). Every arc is simplified once with
+# Douglas-Peucker and reused by all rings that share it, so wards that share a
+# border keep an identical simplified border with no gaps or overlaps.
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Simplification tolerance (degrees) and output coordinate decimals per LOD.
+# LOD 0 is the full-resolution source geometry.
+LOD_LEVELS = {
+    0: {'tolerance': None, 'decimals': None},
+    1: {'tolerance': 0.0001, 'decimals': 5},   # ~11 m
+    2: {'tolerance': 0.0005, 'decimals': 5},   # ~55 m
+    3: {'tolerance': 0.002, 'decimals': 4},    # ~220 m
+}
+MAX_LOD = max(LOD_LEVELS)
+
+# Vertices closer than this (in degrees) are treated as the same point
+_KEY_SCALE = 1e7
+
+Key = Tuple[int, int]
+
+
+def _key(point) -> Key:
+    return (int(round(point[0] * _KEY_SCALE)), int(round(point[1] * _KEY_SCALE)))
+
+
+def _douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Mask of the vertices kept by Douglas-Peucker simplification (endpoints always kept)"""
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a, b = points[i], points[j]
+        segment = points[i + 1:j] - a
+        direction = b - a
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            distance = np.hypot(segment[:, 0], segment[:, 1])
+        else:
+            distance = np.abs(direction[0] * segment[:, 1] - direction[1] * segment[:, 0]) / length
+        k = int(np.argmax(distance))
+        if distance[k] > tolerance:
+            split = i + 1 + k
+            keep[split] = True
+            stack.append((i, split))
+            stack.append((split, j))
+    return keep
+
+
+def _geometry_rings(geometry: Optional[Dict[str, Any]]) -> List[List[List[List[float]]]]:
+    """Polygons of a Polygon/MultiPolygon geometry as lists of rings"""
+    if not geometry:
+        return []
+    if geometry.get('type') == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+class _Topology:
+    """Rings of all wards of a city broken into shared arcs"""
+
+    def __init__(self, features: List[Dict[str, Any]]):
+        # rings[feature][polygon][ring] -> list of vertex keys (open, no closing duplicate)
+        self.rings: List[List[List[List[Key]]]] = []
+        for feature in features:
+            polygons = []
+            for polygon in _geometry_rings(feature.get('geometry')):
+                rings = []
+                for ring in polygon:
+                    keys = [_key(p) for p in ring]
+                    # Drop the closing vertex and consecutive duplicates
+                    keys = [k for i, k in enumerate(keys) if i == 0 or k != keys[i - 1]]
+                    if len(keys) > 1 and keys[0] == keys[-1]:
+                        keys.pop()
+                    if len(keys) >= 3:
+                        rings.append(keys)
+                if rings:
+                    polygons.append(rings)
+            self.rings.append(polygons)
+
+        self.junctions = self._find_junctions()
+
+    def _all_rings(self):
+        for polygons in self.rings:
+            for rings in polygons:
+                yield from rings
+
+    def _find_junctions(self) -> set:
+        """Vertices that appear with different neighbours in different rings"""
+        neighbours: Dict[Key, frozenset] = {}
+        junctions = set()
+        for ring in self._all_rings():
+            n = len(ring)
+            for i, key in enumerate(ring):
+                pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+                seen = neighbours.setdefault(key, pair)
+                if seen != pair:
+                    junctions.add(key)
+        return junctions
+
+    def ring_arcs(self, ring: List[Key]) -> List[Tuple[Tuple[Key, ...], bool]]:
+        """Split a ring into canonical arcs; each item is (arc, reversed)"""
+        cuts = [i for i, key in enumerate(ring) if key in self.junctions]
+        if not cuts:
+            # Unshared (or wholly shared) ring: one closed arc from a canonical start
+            start = ring.index(min(ring))
+            rotated = ring[start:] + ring[:start]
+            arc = tuple(rotated + [rotated[0]])
+            reversed_arc = arc[::-1]
+            return [(reversed_arc, True)] if reversed_arc < arc else [(arc, False)]
+
+        start = cuts[0]
+        rotated = ring[start:] + ring[:start]
+        positions = [i - start for i in cuts] + [len(ring)]
+        closed = rotated + [rotated[0]]
+
+        arcs = []
+        for a, b in zip(positions, positions[1:]):
+            arc = tuple(closed[a:b + 1])
+            reversed_arc = arc[::-1]
+            arcs.append((reversed_arc, True) if reversed_arc < arc else (arc, False))
+        return arcs
+
+
+def simplify_features(features: List[Dict[str, Any]], tolerance: float, decimals: int) -> List[Optional[Dict[str, Any]]]:
+    """Topology-preserving simplification of ward geometries, with coordinates rounded to decimals
+
+    Returns one geometry (or None) per input feature, in the same order.
+    """
+    topology = _Topology(features)
+    simplified: Dict[Tuple[Key, ...], List[Key]] = {}
+    protected = set()
+
+    def simplify_arc(arc):
+        if arc not in simplified:
+            if arc in protected or len(arc) <= 2:
+                simplified[arc] = list(arc)
+            else:
+                points = np.asarray(arc, dtype=np.float64) / _KEY_SCALE
+                keep = _douglas_peucker(points, tolerance)
+                simplified[arc] = [k for k, kept in zip(arc, keep) if kept]
+        return simplified[arc]
+
+    def build_ring(ring):
+        keys: List[Key] = []
+        for arc, is_reversed in topology.ring_arcs(ring):
+            part = simplify_arc(arc)
+            if is_reversed:
+                part = part[::-1]
+            keys.extend(part if not keys else part[1:])
+        coords = []
+        for kx, ky in keys:
+            point = [round(kx / _KEY_SCALE, decimals), round(ky / _KEY_SCALE, decimals)]
+            if not coords or point != coords[-1]:
+                coords.append(point)
+        return coords
+
+    # Rings that collapse below a triangle keep their full-detail arcs; since
+    # arcs are shared, their neighbours pick up the same unsimplified border.
+    while True:
+        collapsed = False
+        for ring in topology._all_rings():
+            coords = build_ring(ring)
+            if len(coords) < 4:
+                arcs = [arc for arc, _ in topology.ring_arcs(ring)]
+                if all(arc in protected for arc in arcs):
+                    continue
+                protected.update(arcs)
+                for arc in arcs:
+                    simplified.pop(arc, None)
+                collapsed = True
+        if not collapsed:
+            break
+
+    geometries: List[Optional[Dict[str, Any]]] = []
+    for feature, polygons in zip(features, topology.rings):
+        if not polygons:
+            # Missing geometry, or degenerate slivers that have nothing to simplify
+            geometries.append(_round_geometry(feature.get('geometry'), decimals))
+            continue
+        coordinates = []
+        for rings in polygons:
+            ring_coords = [build_ring(ring) for ring in rings]
+            ring_coords = [coords for coords in ring_coords if len(coords) >= 4]
+            if ring_coords:
+                coordinates.append(ring_coords)
+        if not coordinates:
+            geometries.append(None)
+        elif feature['geometry']['type'] == 'Polygon':
+            geometries.append({'type': 'Polygon', 'coordinates': coordinates[0]})
+        else:
+            geometries.append({'type': 'MultiPolygon', 'coordinates': coordinates})
+    return geometries
+
+
+def _round_geometry(geometry: Optional[Dict[str, Any]], decimals: int) -> Optional[Dict[str, Any]]:
+    """Copy of a polygon geometry with coordinates rounded to decimals"""
+    polygons = _geometry_rings(geometry)
+    if not polygons:
+        return None
+    rounded = [[[[round(x, decimals), round(y, decimals)] for x, y, *_ in ring] for ring in polygon]
+               for polygon in polygons]
+    if geometry['type'] == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': rounded[0]}
+    return {'type': 'MultiPolygon', 'coordinates': rounded}
+
+
+def lod_geometries(features: List[Dict[str, Any]], lod: int) -> List[Optional[Dict[str, Any]]]:
+    """Geometries of all features at a level of detail (LOD 0 returns the source geometry)"""
+    level = LOD_LEVELS[lod]
+    if level['tolerance'] is None:
+        return [feature.get('geometry') or None for feature in features]
+    return simplify_features(features, level['tolerance'], level['decimals'])
+
+
+def feature_bboxes(features: List[Dict[str, Any]]) -> np.ndarray:
+    """(n, 4) array of west, south, east, north per feature (NaN when it has no geometry)"""
+    boxes = np.full((len(features), 4), np.nan)
+    for i, feature in enumerate(features):
+        points = [p for polygon in _geometry_rings(feature.get('geometry')) for ring in polygon for p in ring]
+        if points:
+            array = np.asarray(points, dtype=np.float64)[:, :2]
+            boxes[i, :2] = array.min(axis=0)
+            boxes[i, 2:] = array.max(axis=0)
+    return boxes
+
+
+def lod_filename(lod: int) -> str:
+    return f"geometry_lod{lod}.json"
+
+
+def save_lod_file(path: Path, source: Dict[str, Any], geometries: List[Optional[Dict[str, Any]]]) -> None:
+    """Write precomputed LOD geometries tagged with the source fingerprint"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({'source': {'mtime_ns': source['mtime_ns'], 'size': source['size']}, 'geometries': geometries},
+                  f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_lod_file(path: Path, source: Dict[str, Any]) -> Optional[List[Optional[Dict[str, Any]]]]:
+    """Read precomputed LOD geometries, or None if missing or built from other data"""
+    try:
+        with open(path, 'r') as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    recorded = stored.get('source', {})
+    if recorded.get('mtime_ns') != source['mtime_ns'] or recorded.get('size') != source['size']:
+        return None
+    return stored['geometries']
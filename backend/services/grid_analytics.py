@@ -0,0 +1,87 @@
+# Grid analytics: hotspots, distribution and ward aggregates of each pollutant
+#
+# Everything is computed on the (cells x pollutants) matrix with NumPy
+# reductions; cells without emissions (the padding around the city) are left
+# out of the percentiles and histograms.
+from typing import Any, Dict
+
+import numpy as np
+
+from services.ward_overlap import WardOverlap
+
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95, 99)
+
+
+def top_k(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values, largest first"""
+    k = min(k, len(values))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    part = np.argpartition(values, len(values) - k)[len(values) - k:]
+    return part[np.argsort(values[part])[::-1]]
+
+
+def pollutant_profile(cell_values: np.ndarray, overlap: WardOverlap) -> Dict[str, Any]:
+    """Parameter-independent part of the analytics of one pollutant grid, worth keeping per city"""
+    values = np.where(np.isfinite(cell_values), cell_values, 0.0)
+    emitting = np.sort(values[values > 0])
+
+    # Ward totals weight each cell by the share of it inside the ward; the maximum is over touched cells
+    ward_total = overlap.aggregate(values)
+    ward_area = np.bincount(overlap.rows, weights=overlap.weights, minlength=overlap.n_wards)
+    ward_max = np.zeros(overlap.n_wards)
+    np.maximum.at(ward_max, overlap.rows, values[overlap.cells])
+    ward_mean = np.divide(ward_total, ward_area, out=np.zeros(overlap.n_wards), where=ward_area > 0)
+
+    percentiles = np.percentile(emitting, PERCENTILES) if len(emitting) else np.zeros(len(PERCENTILES))
+    return {
+        'values': values,
+        'emitting': emitting,
+        'ward_total': ward_total,
+        'summary': {
+            'total': float(values.sum()),
+            'mean': float(emitting.mean()) if len(emitting) else 0.0,
+            'std': float(emitting.std()) if len(emitting) else 0.0,
+            'max': float(values.max()) if len(values) else 0.0,
+            'emitting_cells': int(len(emitting)),
+            'percentiles': {f"p{p}": float(v) for p, v in zip(PERCENTILES, percentiles)},
+        },
+        'wards': {
+            'total': ward_total.tolist(),
+            'mean': ward_mean.tolist(),
+            'max': ward_max.tolist(),
+        },
+    }
+
+
+def pollutant_analytics(profile: Dict[str, Any], lat: np.ndarray, lon: np.ndarray, k: int, bins: int) -> Dict[str, Any]:
+    """Summary statistics, top-k cells, histogram and ward aggregates of one pollutant grid"""
+    values, emitting, ward_total = profile['values'], profile['emitting'], profile['ward_total']
+
+    hotspots = top_k(values, k)
+    rows, cols = np.divmod(hotspots, len(lon))
+
+    if len(emitting):
+        counts, edges = np.histogram(emitting, bins=bins, range=(0.0, float(emitting[-1])))
+    else:
+        counts, edges = np.zeros(bins, dtype=np.int64), np.zeros(bins + 1)
+    top_wards = top_k(ward_total, k)
+
+    return {
+        **profile['summary'],
+        'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+        'hotspots': [
+            {'row': int(r), 'col': int(c), 'lat': float(lat[r]), 'lon': float(lon[c]), 'value': float(values[i])}
+            for i, r, c in zip(hotspots, rows, cols)
+        ],
+        'wards': {
+            **profile['wards'],
+            'top': [{'ward': int(w), 'total': float(ward_total[w])} for w in top_wards],
+        },
+    }
+
+
+def grid_analytics(profiles: Dict[str, Dict[str, Any]], lat: np.ndarray, lon: np.ndarray,
+                   k: int, bins: int) -> Dict[str, Dict[str, Any]]:
+    """pollutant_analytics for the profile of every pollutant"""
+    return {pollutant: pollutant_analytics(profile, lat, lon, k, bins) for pollutant, profile in profiles.items()}
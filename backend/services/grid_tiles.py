@@ -0,0 +1,87 @@
+# Binary emission grid tiles
+#
+# Tiles split the grid in index space: at zoom z the grid is cut into
+# 2^z x 2^z tiles, x counting columns from the west and y counting rows from
+# the south (the same row order as emission_grid). Values are packed row-major
+# and little-endian; a client decodes them as value = raw * scale + offset.
+from typing import Dict, Tuple
+
+import numpy as np
+
+ENCODINGS = ('float32', 'float16', 'uint8')
+MAX_TILE_ZOOM = 5
+
+# uint8 code reserved for missing values
+UINT8_NODATA = 255
+_FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+
+class GridTile:
+    """Encoded block of an emission grid plus the headers needed to decode it"""
+
+    def __init__(self, body: bytes, headers: Dict[str, str]):
+        self.body = body
+        self.headers = headers
+
+
+def tile_bounds(shape: Tuple[int, int], z: int, x: int, y: int) -> Tuple[slice, slice]:
+    """Row and column slices of tile (z, x, y)"""
+    n = 1 << z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} is outside the grid")
+    rows, cols = shape
+    return (
+        slice(y * rows // n, (y + 1) * rows // n),
+        slice(x * cols // n, (x + 1) * cols // n),
+    )
+
+
+def encode_grid(values: np.ndarray, encoding: str) -> Tuple[bytes, float, float]:
+    """Pack values as little-endian float32/float16 or quantized uint8; return (body, scale, offset)"""
+    values = np.asarray(values, dtype=np.float64)
+    finite = values[np.isfinite(values)]
+
+    if encoding == 'float32':
+        return values.astype('<f4').tobytes(), 1.0, 0.0
+
+    if encoding == 'float16':
+        # Rescale only when values would overflow half precision
+        peak = float(np.abs(finite).max()) if finite.size else 0.0
+        scale = peak / _FLOAT16_MAX if peak > _FLOAT16_MAX else 1.0
+        return (values / scale).astype('<f2').tobytes(), scale, 0.0
+
+    if encoding == 'uint8':
+        low = float(finite.min()) if finite.size else 0.0
+        high = float(finite.max()) if finite.size else 0.0
+        scale = (high - low) / (UINT8_NODATA - 1) if high > low else 1.0
+        with np.errstate(invalid='ignore'):
+            codes = np.rint((values - low) / scale)
+        codes = np.where(np.isfinite(codes), codes, UINT8_NODATA).astype(np.uint8)
+        return codes.tobytes(), scale, low
+
+    raise ValueError(f"Unknown encoding '{encoding}', expected one of {', '.join(ENCODINGS)}")
+
+
+def build_tile(grid: np.ndarray, lat: np.ndarray, lon: np.ndarray, encoding: str,
+               rows: slice = slice(None), cols: slice = slice(None)) -> GridTile:
+    """Encode a block of the grid"""
+    block = np.asarray(grid)[rows, cols]
+    body, scale, offset = encode_grid(block, encoding)
+
+    tile_lat = lat[rows]
+    tile_lon = lon[cols]
+    headers = {
+        'X-Grid-Shape': f"{block.shape[0]},{block.shape[1]}",
+        'X-Grid-Dtype': encoding,
+        'X-Grid-Scale': repr(scale),
+        'X-Grid-Offset': repr(offset),
+        'X-Grid-Lat': f"{float(tile_lat[0])!r},{float(tile_lat[-1])!r}" if len(tile_lat) else "",
+        'X-Grid-Lon': f"{float(tile_lon[0])!r},{float(tile_lon[-1])!r}" if len(tile_lon) else "",
+    }
+    if encoding == 'uint8':
+        headers['X-Grid-Nodata'] = str(UINT8_NODATA)
+    return GridTile(body, headers)
+
+
+# Response headers a browser client must be allowed to read
+GRID_HEADERS = ['X-Grid-Shape', 'X-Grid-Dtype', 'X-Grid-Scale', 'X-Grid-Offset', 'X-Grid-Lat', 'X-Grid-Lon', 'X-Grid-Nodata']
@@ -0,0 +1,134 @@
+# Section index for city data.json files
+#
+# The index records the byte span of every top-level member and of the members
+# of top-level objects (e.g. "emissions.summary", "geometry"), so a section can
+# be read with one seek + json.loads instead of parsing the whole file. It is
+# built during the first full parse and stored as a sidecar next to the
+# compiled data, tagged with the source mtime and size.
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import phase
+
+SECTION_INDEX_VERSION = 1
+SECTIONS_FILENAME = "sections.json"
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+def _skip(text: str, pos: int) -> int:
+    return _WHITESPACE.match(text, pos).end()
+
+
+def _parse_object(text: str, pos: int, prefix: str, depth: int,
+                  spans: Dict[str, List[int]]) -> Tuple[Dict[str, Any], int]:
+    """Parse the object at text[pos], recording the span of members down to depth levels"""
+    result: Dict[str, Any] = {}
+    pos = _skip(text, pos + 1)
+    if text[pos] == '}':
+        return result, pos + 1
+
+    while True:
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _skip(text, pos)
+        if text[pos] != ':':
+            raise ValueError(f"Expected ':' at offset {pos}")
+        pos = _skip(text, pos + 1)
+
+        start = pos
+        if depth > 1 and text[pos] == '{':
+            value, pos = _parse_object(text, pos, f"{prefix}{key}.", depth - 1, spans)
+        else:
+            value, pos = _decoder.raw_decode(text, pos)
+        spans[f"{prefix}{key}"] = [start, pos]
+        result[key] = value
+
+        pos = _skip(text, pos)
+        if text[pos] == ',':
+            pos = _skip(text, pos + 1)
+        elif text[pos] == '}':
+            return result, pos + 1
+        else:
+            raise ValueError(f"Expected ',' or '}}' at offset {pos}")
+
+
+def parse_with_index(raw: bytes, depth: int = 2) -> Tuple[Dict[str, Any], Dict[str, List[int]]]:
+    """Parse a JSON object and return it with the byte spans of its sections"""
+    text = raw.decode('utf-8')
+    spans: Dict[str, List[int]] = {}
+    data, _ = _parse_object(text, _skip(text, 0), "", depth, spans)
+
+    if len(text) != len(raw):
+        # Non-ASCII content: convert character offsets to byte offsets
+        spans = {path: [len(text[:a].encode('utf-8')), len(text[:b].encode('utf-8'))]
+                 for path, (a, b) in spans.items()}
+    return data, spans
+
+
+class JsonSectionReader:
+    """Reads sections of a data.json by byte offset, building the index on first use"""
+
+    def __init__(self, source: Path, index_file: Path):
+        self.source = Path(source)
+        self.index_file = Path(index_file)
+        stat = self.source.stat()
+        self._fingerprint = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+        self._spans: Optional[Dict[str, List[int]]] = self._load_index()
+        # Sections parsed by a full read, kept so that read pays for itself
+        self._parsed: Optional[Dict[str, Any]] = None
+
+    def _load_index(self) -> Optional[Dict[str, List[int]]]:
+        try:
+            with open(self.index_file, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored.get('version') != SECTION_INDEX_VERSION or stored.get('source') != self._fingerprint:
+            return None
+        return stored['sections']
+
+    def _build_index(self) -> None:
+        """Parse the whole file once and store the section spans"""
+        with phase('file_read'), open(self.source, 'rb') as f:
+            raw = f.read()
+        with phase('json_parse'):
+            self._parsed, self._spans = parse_with_index(raw)
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': SECTION_INDEX_VERSION, 'source': self._fingerprint,
+                           'sections': self._spans}, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            # Read-only data directory, the index lives for this reader only
+            pass
+
+    def has(self, path: str) -> bool:
+        if self._spans is None:
+            self._build_index()
+        return path in self._spans
+
+    def read(self, path: str) -> Any:
+        """Value of a section such as 'static_info' or 'emissions.summary'"""
+        if self._spans is None:
+            self._build_index()
+
+        if self._parsed is not None:
+            value = self._parsed
+            for key in path.split('.'):
+                value = value[key]
+            return value
+
+        if path not in self._spans:
+            raise KeyError(path)
+        start, end = self._spans[path]
+        with phase('file_read'), open(self.source, 'rb') as f:
+            f.seek(start)
+            raw = f.read(end - start)
+        with phase('json_parse'):
+            return json.loads(raw)
@@ -0,0 +1,245 @@
+# National cross-city index
+import json
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.city_dataset import open_city_reader
+from services.simple_data_service import SimpleDataService
+
+INDEX_VERSION = 1
+POLLUTANTS = ('co2', 'nox', 'pm25')
+
+# Default policy pool size limit: every worker holds its own city cache
+MAX_DEFAULT_WORKERS = 4
+
+
+def _read_city_entry(data_dir: Path, city: str, source: Path) -> Dict[str, Any]:
+    """Build the index row of a city from its static info and emission summary"""
+    reader = open_city_reader(data_dir, city, source)
+    static_info = reader.read('static_info') if reader.has('static_info') else {}
+    summary = reader.read('emissions.summary')
+    if reader.has('geometry.feature_count'):
+        feature_count = reader.read('geometry.feature_count')
+    else:
+        feature_count = len(reader.read('geometry').get('features', []))
+
+    population = static_info.get('population_2020') or 0
+    entry = {
+        'city': city,
+        'state': static_info.get('state', 'UNKNOWN'),
+        'population': int(population),
+        'urban_area_km2': float(static_info.get('urban_area_km2') or 0),
+        'gdp_billion_usd': float(static_info.get('GDP_2020_billion_USD') or 0),
+        'road_length_km': float(static_info.get('road_length_km') or 0),
+        'ward_count': feature_count,
+        'co2': float(summary['co2_total_sum']),
+        'nox': float(summary['nox_total_sum']),
+        'pm25': float(summary['pm25_total_sum']),
+    }
+    entry['total'] = entry['co2'] + entry['nox'] + entry['pm25']
+    return entry
+
+
+def _aggregate(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum emissions, population and size over index rows and derive per-capita values"""
+    population = sum(e['population'] for e in entries)
+    result = {
+        'city_count': len(entries),
+        'population': population,
+        'urban_area_km2': sum(e['urban_area_km2'] for e in entries),
+        'road_length_km': sum(e['road_length_km'] for e in entries),
+    }
+    for key in POLLUTANTS + ('total',):
+        result[key] = sum(e[key] for e in entries)
+        result[f'{key}_per_capita'] = result[key] / population if population else 0.0
+    return result
+
+
+# Per-process data service of policy workers
+_worker_service: Optional[SimpleDataService] = None
+
+
+def _init_worker(data_dir: str) -> None:
+    global _worker_service
+    _worker_service = SimpleDataService(data_dir)
+
+
+def _evaluate_city_policy(city: str, pricing_intensity: float, ward_fraction: float,
+                          service: Optional[SimpleDataService] = None) -> Dict[str, Any]:
+    """Apply one policy to the highest-emitting wards of a city (in a worker process, or with the given service)"""
+    service = service or _worker_service
+    overlap = service.get_ward_overlap(city)
+    dataset = service.load_dataset(city)
+
+    n_wards = math.ceil(overlap.n_wards * ward_fraction)
+    ward_totals = overlap.ward_totals(dataset.grids['co2'])
+    selected = np.argsort(-ward_totals, kind='stable')[:n_wards].tolist()
+
+    result = service.apply_congestion_pricing(city, selected, pricing_intensity)
+    return {
+        'city': city,
+        'selected_wards': len(selected),
+        'baseline': result.baseline_stats.model_dump(),
+        'projected': result.projected_stats.model_dump(),
+        'reduction_percentage': result.reduction_percentage,
+        'estimated_cost_savings': result.estimated_cost_savings,
+    }
+
+
+class NationalIndex:
+    """Summary index over all cities, refreshed incrementally as city files change
+
+    National policies run in a process pool when workers > 1, and otherwise
+    in-process with the given data service (so its city cache is reused).
+    """
+
+    def __init__(self, data_dir: Path, index_file: Optional[Path] = None, workers: Optional[int] = None,
+                 service: Optional[SimpleDataService] = None):
+        self.data_dir = Path(data_dir)
+        self.index_file = Path(index_file) if index_file else self.data_dir / "others" / "national_index.json"
+        self.workers = (workers or int(os.environ.get('NATIONAL_POOL_WORKERS', 0))
+                        or min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS))
+        self.service = service
+
+        # city -> {'fingerprint': [mtime_ns, size], 'entry': {...}}
+        self._cities: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._load_index_file()
+
+    def _load_index_file(self) -> None:
+        try:
+            with open(self.index_file, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        if stored.get('version') == INDEX_VERSION:
+            self._cities = stored.get('cities', {})
+
+    def _save_index_file(self) -> None:
+        try:
+            tmp_file = self.index_file.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'cities': self._cities}, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            # Read-only data directory, the index is rebuilt in memory on startup
+            pass
+
+    def refresh(self) -> List[str]:
+        """Re-read cities whose data.json changed; return the names of updated cities"""
+        with self._lock:
+            seen = set()
+            updated = []
+            for city_dir in sorted(self.data_dir.iterdir()):
+                source = city_dir / "data.json"
+                if not source.is_file():
+                    continue
+                city = city_dir.name
+                seen.add(city)
+
+                stat = source.stat()
+                fingerprint = [stat.st_mtime_ns, stat.st_size]
+                known = self._cities.get(city)
+                if known is not None and known['fingerprint'] == fingerprint:
+                    continue
+
+                self._cities[city] = {
+                    'fingerprint': fingerprint,
+                    'entry': _read_city_entry(self.data_dir, city, source),
+                }
+                updated.append(city)
+
+            removed = set(self._cities) - seen
+            for city in removed:
+                del self._cities[city]
+
+            if updated or removed:
+                self._save_index_file()
+            return updated
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Index rows of all cities"""
+        self.refresh()
+        return [self._cities[city]['entry'] for city in sorted(self._cities)]
+
+    def national_summary(self) -> Dict[str, Any]:
+        """National totals, per-capita emissions and the per-city rows"""
+        entries = self.entries()
+        summary = _aggregate(entries)
+        summary['cities'] = entries
+        return summary
+
+    def state_summaries(self) -> List[Dict[str, Any]]:
+        """Aggregates per state, largest total emissions first"""
+        by_state: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self.entries():
+            by_state.setdefault(entry['state'], []).append(entry)
+
+        states = []
+        for state, entries in by_state.items():
+            aggregate = _aggregate(entries)
+            aggregate['state'] = state
+            aggregate['cities'] = [e['city'] for e in entries]
+            states.append(aggregate)
+        return sorted(states, key=lambda s: s['total'], reverse=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created lazily from a pool thread, so workers must not be forked from this
+        # multi-threaded process: they start from a fork server (or are spawned)
+        with self._pool_lock:
+            if self._pool is None:
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker,
+                    initargs=(str(self.data_dir),),
+                )
+            return self._pool
+
+    def apply_policy_everywhere(self, pricing_intensity: float, ward_fraction: float = 1.0,
+                                cities: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Apply the same policy in every city, spreading cities over a process pool"""
+        if cities is None:
+            cities = [entry['city'] for entry in self.entries()]
+
+        if self.workers > 1 and len(cities) > 1:
+            pool = self._get_pool()
+            futures = [pool.submit(_evaluate_city_policy, city, pricing_intensity, ward_fraction) for city in cities]
+            results = [future.result() for future in futures]
+        else:
+            if self.service is None:
+                self.service = SimpleDataService(str(self.data_dir))
+            results = [_evaluate_city_policy(city, pricing_intensity, ward_fraction, self.service) for city in cities]
+
+        totals = {}
+        for stage in ('baseline', 'projected'):
+            totals[stage] = {key: sum(r[stage][key] for r in results) for key in POLLUTANTS + ('total',)}
+        totals['reduction_percentage'] = {
+            key: (totals['baseline'][key] - totals['projected'][key]) / totals['baseline'][key] * 100
+            if totals['baseline'][key] else 0.0
+            for key in POLLUTANTS + ('total',)
+        }
+        totals['estimated_cost_savings'] = sum(r['estimated_cost_savings'] for r in results)
+
+        return {
+            'pricing_intensity': pricing_intensity,
+            'ward_fraction': ward_fraction,
+            'national': totals,
+            'cities': results,
+        }
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
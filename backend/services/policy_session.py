@@ -0,0 +1,97 @@
+# Interactive policy sessions
+#
+# A session holds the current ward selection and pricing intensity of one
+# client together with running sums, so toggling a ward only touches the grid
+# cells of that ward and the wards sharing them, and moving the intensity
+# slider only rescales the sums. The results match apply_congestion_pricing.
+#
+# Coverage is at most 1 and the intensity at most 100%, so as long as no base
+# rate exceeds the per-cell cap the cap never binds and reductions stay linear
+# in the coverage; the session checks that once instead of applying the cap.
+from typing import Dict, Iterable, Set
+
+import numpy as np
+
+from services.ward_overlap import WardOverlap
+
+# Coverage left over after removing a ward is rounding noise below this
+_COVERAGE_EPSILON = 1e-9
+
+
+class PolicySession:
+    """Ward selection and intensity of one client, with incrementally maintained reductions"""
+
+    def __init__(self, overlap: WardOverlap, values: np.ndarray, rates: np.ndarray, max_reduction: float,
+                 pricing_intensity: float = 0.0):
+        if float(rates.max()) > max_reduction:
+            raise ValueError("Base rates above the reduction cap are not linear in coverage")
+        self.overlap = overlap
+        # Emissions per cell and pollutant, (cells x pollutants)
+        self.values = values
+        self.rates = rates
+        self.intensity = 0.0
+        self.set_intensity(pricing_intensity)
+
+        self.selected: Set[int] = set()
+        # Summed overlap of the selected wards per cell
+        self.raw = np.zeros(overlap.n_cells)
+        # sum over cells of values * coverage: the reduction per unit of rate x intensity
+        self.weighted = np.zeros(values.shape[1])
+        # Same per selected ward, for the ward's share of each cell
+        self.ward_weighted: Dict[int, np.ndarray] = {}
+
+    @property
+    def pricing_intensity(self) -> float:
+        return self.intensity * 100
+
+    def _ward_weighted(self, ward: int) -> np.ndarray:
+        cells, weights = self.overlap.ward_entries(ward)
+        raw = self.raw[cells]
+        # Ward share of the cell (weight / raw) times the cell coverage (min(raw, 1))
+        factor = np.divide(weights * np.minimum(raw, 1.0), raw, out=np.zeros(len(cells)), where=raw > 0)
+        return factor @ self.values[cells]
+
+    def update(self, add: Iterable[int] = (), remove: Iterable[int] = ()) -> Set[int]:
+        """Change the selection; return the selected wards whose reductions changed"""
+        n_wards = self.overlap.n_wards
+        add = {w for w in add if 0 <= w < n_wards and w not in self.selected}
+        remove = {w for w in remove if w in self.selected} - add
+        if not add and not remove:
+            return set()
+
+        entries = {ward: self.overlap.ward_entries(ward) for ward in add | remove}
+        touched = np.unique(np.concatenate([cells for cells, _ in entries.values()]))
+        old_coverage = np.minimum(self.raw[touched], 1.0)
+
+        for ward in remove:
+            cells, weights = entries[ward]
+            self.raw[cells] -= weights
+            self.selected.discard(ward)
+            del self.ward_weighted[ward]
+        for ward in add:
+            cells, weights = entries[ward]
+            self.raw[cells] += weights
+            self.selected.add(ward)
+        self.raw[touched] = np.where(self.raw[touched] < _COVERAGE_EPSILON, 0.0, self.raw[touched])
+
+        self.weighted += (np.minimum(self.raw[touched], 1.0) - old_coverage) @ self.values[touched]
+
+        # Wards sharing a touched cell get a different share of it; added wards may have no cells at all
+        changed = ({int(w) for w in self.overlap.wards_touching(touched)} & self.selected) | add
+        for ward in changed:
+            self.ward_weighted[ward] = self._ward_weighted(ward)
+        return changed
+
+    def set_intensity(self, pricing_intensity: float) -> None:
+        if not 0 <= pricing_intensity <= 100:
+            raise ValueError("Pricing intensity must be between 0 and 100")
+        self.intensity = pricing_intensity / 100
+
+    def reduced(self) -> np.ndarray:
+        """Tons removed per pollutant"""
+        return self.intensity * self.rates * self.weighted
+
+    def ward_reductions(self, wards: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Tons removed per pollutant attributed to each of the given selected wards"""
+        return {ward: self.intensity * self.rates * self.ward_weighted[ward]
+                for ward in sorted(w for w in wards if w in self.selected)}
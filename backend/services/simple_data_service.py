@@ -1,14 +1,80 @@
-import json
 from pathlib import Path
-from typing import List, Dict, Any
+import io
+import mmap
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
 import os
 
-from models import CityEmissionData, PolicyResponse, EmissionStats, RoadFeature, EmissionPoint
+import numpy as np
+
+from models import (CityEmissionData, PolicyResponse, PolicySweepResponse, EmissionStats, RoadFeature, EmissionPoint,
+                    GridCell, WardSummary, PointLookupResponse, BBoxQueryResponse, WardOptimizationResponse)
+from services.city_cache import CityDataCache
+from services import compiled_format
+from services.city_dataset import CityDataset, POLLUTANT_GRIDS, open_city_reader
+from services.ward_overlap import WardOverlap, OVERLAP_FILENAME, DEFAULT_SAMPLES, half_cell
+from services.policy_session import PolicySession
+from services.spatial_index import SpatialIndex
+from services.grid_analytics import grid_analytics, pollutant_profile
+from services import ward_optimizer
+from services import geometry_lod
+from services import grid_tiles
+from metrics import phase
+from http_cache import json_bytes
+
+# Maximum reduction per pollutant at 100% pricing intensity on a fully covered cell
+BASE_REDUCTIONS = {
+    'co2': 0.30,    # 30% max reduction for CO2
+    'nox': 0.35,    # 35% max reduction for NOx
+    'pm25': 0.40,   # 40% max reduction for PM2.5
+}
+MAX_REDUCTION = 0.5  # Cap at 50% reduction
+
+# Largest number of scenarios evaluated in one sweep
+MAX_SWEEP_SCENARIOS = 10000
+
+# Parts of the /city payload that can be requested on their own, and the response keys they fill
+CITY_FIELDS = {
+    'grid': ('emission_grid', 'coordinates'),
+    'roads': ('roads',),
+    'stats': ('baseline_stats',),
+    'bounds': ('bounds',),
+}
+
+# Cost resolution of the exact ward optimizer for the road length objective (km)
+ROAD_LENGTH_STEP_KM = 0.5
+
+# Grid rows and ward features per line of a streamed /city payload
+STREAM_GRID_ROWS = 32
+STREAM_FEATURES = 16
+
+# Compile missing or outdated city data on first load, so workers map it instead of parsing data.json
+COMPILE_ON_LOAD = os.environ.get('COMPILE_ON_LOAD', '1') != '0'
+
+# Damage cost per ton ($50 CO2, $100 NOx, $200 PM2.5)
+COST_PER_TON = {
+    'co2': 50,
+    'nox': 100,
+    'pm25': 200,
+}
+
+def _as_list(values):
+    """Convert NumPy arrays to (nested) Python lists, pass lists through"""
+    return values.tolist() if isinstance(values, np.ndarray) else values
+
+def _roads_line(start: int, features: bytes) -> bytes:
+    """NDJSON line of a chunk of pre-encoded, comma-separated ward features"""
+    with phase('serialize'):
+        return b'{"section":"roads","start":' + str(start).encode() + b',"data":[' + features + b']}\n'
 
 class SimpleDataService:
-    """Simplified service for loading JSON-based city data"""
+    """Simplified service for loading JSON-based city data
+    
+    Response models are built with model_construct: city data is trusted once
+    it is loaded and every value is produced here with the right type, so
+    validating it again would only walk the grids and geometry twice.
+    """
     
-    def __init__(self, data_dir: str = None):
+    def __init__(self, data_dir: str = None, cache: CityDataCache = None):
         if data_dir is None:
             # Try to find data directory relative to this file
             current_dir = Path(__file__).parent
@@ -24,49 +90,359 @@ class SimpleDataService:
         else:
             self.data_dir = Path(data_dir)
         
-    def load_city_data(self, city: str) -> CityEmissionData:
-        """Load complete city data from simplified JSON format"""
+        # Parsed city data is cached and reused until the file on disk changes
+        self.cache = cache if cache is not None else CityDataCache.from_env()
+        
+    def load_dataset(self, city: str) -> CityDataset:
+        """Open the city dataset, served from the cache when the file is unchanged"""
         
-        # Load the unified JSON data
         json_file = self.data_dir / city / "data.json"
         if not json_file.exists():
             raise FileNotFoundError(f"No data file found for {city}")
         
-        with open(json_file, 'r') as f:
-            data = json.load(f)
+        return self.cache.get(city, json_file, lambda: self._open_city(city, json_file))
+    
+    def load_city_data(self, city: str) -> CityEmissionData:
+        """Load complete city data"""
+        return self.load_dataset(city).data
+    
+    def load_city_view(self, city: str, lod: int = 0, bbox: Optional[Sequence[float]] = None) -> CityEmissionData:
+        """City data at a geometry level of detail, optionally clipped to a west/south/east/north bbox"""
+        
+        dataset = self.load_dataset(city)
+        if lod == 0 and bbox is None:
+            return dataset.data
+        
+        roads = self._roads(dataset, lod)
+        bounds = self._bounds(dataset)
         
-        # Extract emission data
-        emission_data = self._process_emission_data(data['emissions'])
+        if bbox is None:
+            emission_data = self._emission_data(dataset)
+            emission_grid = emission_data['emission_grid']
+            coordinates = emission_data['coordinates']
+        else:
+            west, south, east, north = bbox
+            
+            # Keep wards whose bounding box intersects the requested one
+            boxes = dataset.memo('feature_bboxes', lambda: geometry_lod.feature_bboxes(dataset.features))
+            with np.errstate(invalid='ignore'):
+                hit = (boxes[:, 0] <= east) & (boxes[:, 2] >= west) & (boxes[:, 1] <= north) & (boxes[:, 3] >= south)
+            roads = [road for road in roads if hit[road.properties['road_id']]]
+            
+            # Keep grid cells that overlap the bbox
+            h_lat, h_lon = half_cell(dataset.lat), half_cell(dataset.lon)
+            rows = np.nonzero((dataset.lat + h_lat >= south) & (dataset.lat - h_lat <= north))[0]
+            cols = np.nonzero((dataset.lon + h_lon >= west) & (dataset.lon - h_lon <= east))[0]
+            coordinates = {
+                'latitudes': dataset.lat[rows].tolist(),
+                'longitudes': dataset.lon[cols].tolist()
+            }
+            emission_grid = dataset.grids['co2'][np.ix_(rows, cols)].tolist()
+            if len(rows) and len(cols):
+                bounds = self._calculate_bounds(coordinates, roads)
         
-        # Extract road data from GeoJSON
-        road_data = self._process_road_data(data['geometry'])
+        baseline_stats = self._baseline_stats(dataset)
+        with phase('build_model'):
+            return CityEmissionData.model_construct(
+                city=city,
+                emission_grid=emission_grid,
+                coordinates=coordinates,
+                roads=roads,
+                baseline_stats=baseline_stats,
+                bounds=bounds
+            )
+    
+    def load_city_fields(self, city: str, fields: Sequence[str], lod: int = 0,
+                         bbox: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+        """Selected parts of the city payload (see CITY_FIELDS), reading only the sections they need"""
         
-        # Calculate baseline statistics
-        baseline_stats = self._calculate_baseline_stats(data['emissions']['summary'])
+        unknown = [field for field in fields if field not in CITY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}; expected any of {', '.join(CITY_FIELDS)}")
+        keys = {key for field in fields for key in CITY_FIELDS[field]}
         
-        # Calculate bounds
-        bounds = self._calculate_bounds(emission_data['coordinates'], road_data)
+        if bbox is not None:
+            # Clipping ties the grid and wards together, build the clipped view and pick from it
+            view = self.load_city_view(city, lod=lod, bbox=bbox)
+            return view.model_dump(include={'city'} | keys)
         
-        return CityEmissionData(
-            city=city,
-            emission_grid=emission_data['emission_grid'],
-            coordinates=emission_data['coordinates'],
-            roads=road_data,
-            baseline_stats=baseline_stats,
-            bounds=bounds
-        )
+        dataset = self.load_dataset(city)
+        parts: Dict[str, Any] = {'city': city}
+        if 'emission_grid' in keys:
+            parts.update(self._emission_data(dataset))
+        if 'roads' in keys:
+            parts['roads'] = [road.model_dump() for road in self._roads(dataset, lod)]
+        if 'baseline_stats' in keys:
+            parts['baseline_stats'] = self._baseline_stats(dataset).model_dump()
+        if 'bounds' in keys:
+            parts['bounds'] = self._bounds(dataset)
+        
+        # Same key order as CityEmissionData
+        return {key: parts[key] for key in CityEmissionData.model_fields if key in parts}
+    
+    def _city_keys(self, fields: Optional[Sequence[str]]) -> set:
+        """CityEmissionData keys covered by the given CITY_FIELDS (all of them for None)"""
+        if fields is None:
+            return set(CityEmissionData.model_fields)
+        unknown = [field for field in fields if field not in CITY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}; expected any of {', '.join(CITY_FIELDS)}")
+        return {'city'} | {key for field in fields for key in CITY_FIELDS[field]}
+    
+    def load_city_json(self, city: str, lod: int = 0, fields: Optional[Sequence[str]] = None) -> bytes:
+        """Encoded city payload, all of it or the given CITY_FIELDS, without building the response model
+        
+        The ward features come pre-encoded from the compiled data, so the
+        geometry is neither parsed nor held as Python objects.
+        """
+        
+        keys = self._city_keys(fields)
+        
+        dataset = self.load_dataset(city)
+        parts: Dict[str, bytes] = {}
+        if 'roads' in keys:
+            parts['roads'] = self.roads_json(dataset, lod)
+        with phase('serialize'):
+            parts['city'] = json_bytes(city)
+            if 'emission_grid' in keys:
+                parts['emission_grid'] = json_bytes(np.asarray(dataset.grids['co2'], dtype=np.float64))
+                parts['coordinates'] = json_bytes({'latitudes': dataset.lat, 'longitudes': dataset.lon})
+            if 'baseline_stats' in keys:
+                parts['baseline_stats'] = self._baseline_stats(dataset).model_dump_json().encode()
+            if 'bounds' in keys:
+                parts['bounds'] = json_bytes(self._bounds(dataset))
+            
+            # Same key order as CityEmissionData
+            return b'{' + b','.join(json_bytes(key) + b':' + parts[key]
+                                    for key in CityEmissionData.model_fields if key in parts) + b'}'
+    
+    def stream_city_ndjson(self, city: str, lod: int = 0, fields: Optional[Sequence[str]] = None) -> Iterator[bytes]:
+        """City payload as NDJSON lines, encoded one section or chunk at a time
+        
+        Every line is {"section": key, "data": value} for a CityEmissionData key;
+        emission_grid rows and roads come in chunks with a "start" index, so
+        concatenating their data gives the full lists. Sections arrive as
+        city, baseline_stats, bounds, coordinates, emission_grid, roads and a
+        final "end" line with the row and feature counts.
+        """
+        
+        keys = self._city_keys(fields)
+        
+        def line(section: str, data: Any, start: Optional[int] = None) -> bytes:
+            with phase('serialize'):
+                item = {'section': section, 'data': data} if start is None else \
+                    {'section': section, 'start': start, 'data': data}
+                return json_bytes(item) + b'\n'
+        
+        dataset = self.load_dataset(city)
+        yield line('city', city)
+        # Stats and bounds come from the summary and the grid axes, ahead of any bulk data
+        if 'baseline_stats' in keys:
+            yield line('baseline_stats', self._baseline_stats(dataset).model_dump())
+        if 'bounds' in keys:
+            yield line('bounds', self._bounds(dataset))
+        
+        rows = features = 0
+        if 'emission_grid' in keys:
+            yield line('coordinates', {'latitudes': dataset.lat, 'longitudes': dataset.lon})
+            grid = dataset.grids['co2']
+            rows = len(grid)
+            for start in range(0, rows, STREAM_GRID_ROWS):
+                yield line('emission_grid', np.asarray(grid[start:start + STREAM_GRID_ROWS], dtype=np.float64), start)
+        if 'roads' in keys:
+            # Slice chunks of features straight out of the pre-encoded array by their byte offsets
+            encoded, offsets = self.roads_index(dataset, lod)
+            try:
+                features = len(offsets) - 1
+                for start in range(0, features, STREAM_FEATURES):
+                    stop = min(start + STREAM_FEATURES, features)
+                    yield _roads_line(start, encoded[offsets[start]:offsets[stop] - 1])
+            finally:
+                if isinstance(encoded, mmap.mmap):
+                    encoded.close()
+        yield line('end', {'rows': rows, 'features': features})
+    
+    def city_payload_file(self, city: str, lod: int = 0) -> Optional[Path]:
+        """/city payload precompressed by process_data.py, when its artifacts are current"""
+        dataset = self.load_dataset(city)
+        manifest = dataset.manifest
+        if manifest is None or not compiled_format.artifacts_current(dataset.compiled_dir, manifest):
+            return None
+        path = dataset.compiled_dir / compiled_format.payload_filename(lod)
+        return path if path.exists() else None
+    
+    def roads_json(self, dataset: CityDataset, lod: int = 0) -> bytes:
+        """Ward features of a level of detail as encoded JSON, stored with the compiled data once built"""
+        
+        roads_file, offsets_file = self._roads_files(dataset, lod)
+        if roads_file is not None and offsets_file.exists():
+            try:
+                with phase('file_read'):
+                    return roads_file.read_bytes()
+            except FileNotFoundError:
+                pass
+        return self._encode_roads(dataset, lod)[0]
+    
+    def roads_index(self, dataset: CityDataset, lod: int = 0) -> Tuple[Any, np.ndarray]:
+        """Encoded ward features of a level of detail and the byte offset of each feature
+        
+        Feature i spans encoded[offsets[i]:offsets[i + 1] - 1], so features i to j
+        are encoded[offsets[i]:offsets[j] - 1] with their separating commas. The
+        stored array is memory-mapped (close it when done) rather than read.
+        """
+        
+        roads_file, offsets_file = self._roads_files(dataset, lod)
+        if roads_file is not None:
+            try:
+                with phase('file_read'):
+                    offsets = np.load(offsets_file)
+                    with open(roads_file, 'rb') as f:
+                        encoded = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(encoded) == offsets[-1]:
+                    return encoded, offsets
+                encoded.close()
+            except (OSError, ValueError):
+                pass
+        return self._encode_roads(dataset, lod)
+    
+    @staticmethod
+    def _roads_files(dataset: CityDataset, lod: int):
+        """Stored encoded features of a level of detail and their offsets, or (None, None) without compiled data"""
+        if dataset.compiled_dir is None:
+            return None, None
+        return (dataset.compiled_dir / f"roads_lod{lod}.json",
+                dataset.compiled_dir / f"roads_lod{lod}.offsets.npy")
+    
+    def _encode_roads(self, dataset: CityDataset, lod: int) -> Tuple[bytes, np.ndarray]:
+        """Encode the ward features one by one, recording their offsets, and store both when possible"""
+        
+        roads = self._roads(dataset, lod)
+        with phase('serialize'):
+            parts = [json_bytes(road.model_dump()) for road in roads]
+            encoded = b'[' + b','.join(parts) + b']'
+            # Every feature is followed by one byte, a comma or the closing bracket
+            offsets = np.concatenate([[1], 1 + np.cumsum([len(part) + 1 for part in parts], dtype=np.int64)])
+        
+        roads_file, offsets_file = self._roads_files(dataset, lod)
+        if roads_file is not None:
+            buffer = io.BytesIO()
+            np.save(buffer, offsets)
+            try:
+                # Offsets first: features without offsets are encoded again
+                compiled_format.write_artifact(offsets_file, buffer.getvalue())
+                compiled_format.write_artifact(roads_file, encoded)
+            except OSError:
+                # Read-only compiled directory, encode again next time
+                pass
+        return encoded, offsets
+    
+    def _roads(self, dataset: CityDataset, lod: int) -> List[RoadFeature]:
+        """Road features of a city at a level of detail"""
+        if lod == 0:
+            return dataset.memo(('roads', 0), lambda: self._process_road_data(dataset.section('geometry')))
+        return dataset.memo(('roads', lod), lambda: self._lod_roads(dataset, lod))
+    
+    def _lod_roads(self, dataset: CityDataset, lod: int) -> List[RoadFeature]:
+        """Road features with simplified geometry, precomputed by process_data.py when available"""
+        
+        lod_file = compiled_format.compiled_dir(self.data_dir, dataset.city) / geometry_lod.lod_filename(lod)
+        geometries = geometry_lod.load_lod_file(lod_file, dataset.source_stat)
+        if geometries is None or len(geometries) != len(dataset.features):
+            features = dataset.features
+            with phase('simplify'):
+                geometries = geometry_lod.lod_geometries(features, lod)
+        
+        features = [
+            {'type': 'Feature', 'geometry': geometry, 'properties': dict(feature.get('properties') or {})}
+            for feature, geometry in zip(dataset.features, geometries)
+        ]
+        return self._process_road_data({'features': features})
+    
+    def get_grid_tile(self, city: str, pollutant: str, encoding: str = 'float32',
+                      tile: Optional[Sequence[int]] = None) -> grid_tiles.GridTile:
+        """Encoded emission grid of one pollutant, whole or as tile (z, x, y); memoized per city"""
+        
+        if pollutant not in POLLUTANT_GRIDS:
+            raise ValueError(f"Unknown pollutant '{pollutant}', expected one of {', '.join(POLLUTANT_GRIDS)}")
+        if encoding not in grid_tiles.ENCODINGS:
+            raise ValueError(f"Unknown encoding '{encoding}', expected one of {', '.join(grid_tiles.ENCODINGS)}")
+        
+        dataset = self.load_dataset(city)
+        grid = dataset.grids[pollutant]
+        
+        if tile is None:
+            return dataset.memo(('grid', pollutant, encoding), lambda: grid_tiles.build_tile(
+                grid, dataset.lat, dataset.lon, encoding))
+        
+        z, x, y = tile
+        if not 0 <= z <= grid_tiles.MAX_TILE_ZOOM:
+            raise ValueError(f"Zoom must be between 0 and {grid_tiles.MAX_TILE_ZOOM}")
+        rows, cols = grid_tiles.tile_bounds(grid.shape, z, x, y)
+        return dataset.memo(('tile', pollutant, encoding, z, x, y), lambda: grid_tiles.build_tile(
+            grid, dataset.lat, dataset.lon, encoding, rows, cols))
+    
+    def memo(self, city: str, key: Any, compute):
+        """Memoize a value derived from a city, invalidated together with its cached data"""
+        return self.load_dataset(city).memo(key, compute)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss/eviction counters of the city data cache"""
+        return self.cache.stats()
+    
+    def _open_city(self, city: str, json_file: Path) -> CityDataset:
+        """Open a city for reading, preferring the compiled binary format when it is up to date"""
+        reader = open_city_reader(self.data_dir, city, json_file, compile_stale=COMPILE_ON_LOAD)
+        return CityDataset(city, json_file, reader, self._build_city_data)
+    
+    def _build_city_data(self, dataset: CityDataset) -> CityEmissionData:
+        """Assemble the complete city payload"""
+        emission_data = self._emission_data(dataset)
+        roads = self._roads(dataset, 0)
+        baseline_stats = self._baseline_stats(dataset)
+        bounds = self._bounds(dataset)
+        with phase('build_model'):
+            return CityEmissionData.model_construct(
+                city=dataset.city,
+                emission_grid=emission_data['emission_grid'],
+                coordinates=emission_data['coordinates'],
+                roads=roads,
+                baseline_stats=baseline_stats,
+                bounds=bounds
+            )
+    
+    def _emission_data(self, dataset: CityDataset) -> Dict[str, Any]:
+        """Emission grid and coordinate lists, without touching the ward geometry
+        
+        Not memoized: the lists are private copies of the memory-mapped grids
+        and only feed response models, which are cached as encoded bodies.
+        """
+        return self._process_emission_data({
+            'coordinates': dataset.section('emissions.coordinates'),
+            'emissions': dataset.section('emissions.emissions'),
+        })
+    
+    def _baseline_stats(self, dataset: CityDataset) -> EmissionStats:
+        """Baseline statistics, read from the summary section only"""
+        return dataset.memo('baseline_stats', lambda: self._calculate_baseline_stats(dataset.summary))
+    
+    def _bounds(self, dataset: CityDataset) -> Dict[str, float]:
+        """Map bounds of the whole city"""
+        # Bounds only depend on the grid axes, so the ward geometry is not loaded for them
+        return dataset.memo('bounds', lambda: self._calculate_bounds(
+            {'latitudes': dataset.lat.tolist(), 'longitudes': dataset.lon.tolist()}, []))
     
     def _process_emission_data(self, emission_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process emission data from JSON format"""
         
-        # Extract coordinates
-        coordinates = {
-            'latitudes': emission_data['coordinates']['lat'],
-            'longitudes': emission_data['coordinates']['lon']
-        }
-        
-        # Use CO2 data as the main emission grid for visualization
-        emission_grid = emission_data['emissions']['co2_total']
+        with phase('process_grid'):
+            # Extract coordinates (lists from JSON, arrays from the compiled format)
+            coordinates = {
+                'latitudes': _as_list(emission_data['coordinates']['lat']),
+                'longitudes': _as_list(emission_data['coordinates']['lon'])
+            }
+            
+            # Use CO2 data as the main emission grid for visualization
+            emission_grid = _as_list(emission_data['emissions']['co2_total'])
         
         return {
             'emission_grid': emission_grid,
@@ -79,30 +455,31 @@ class SimpleDataService:
         roads = []
         features = geojson_data.get('features', [])
         
-        for i, feature in enumerate(features):
-            # Skip features with missing or null geometry
-            geometry = feature.get('geometry')
-            if not geometry:
-                continue
+        with phase('process_roads'):
+            for i, feature in enumerate(features):
+                # Skip features with missing or null geometry
+                geometry = feature.get('geometry')
+                if not geometry:
+                    continue
+                    
+                # Ensure properties exist
+                properties = feature.get('properties', {})
+                ward_no = properties.get('Ward_No.', i + 1)
                 
-            # Ensure properties exist
-            properties = feature.get('properties', {})
-            ward_no = properties.get('Ward_No.', i + 1)
-            
-            # Update properties with ward information
-            properties.update({
-                'road_id': i,
-                'name': f'Ward {ward_no}',
-                'ward_number': ward_no,
-                'Wards': f'W/{ward_no:02d}',  # Format as W/01, W/02, etc.
-                'ward_category': 'Municipal Ward'
-            })
-            
-            roads.append(RoadFeature(
-                type=feature.get('type', 'Feature'),
-                geometry=geometry,
-                properties=properties
-            ))
+                # Update properties with ward information
+                properties.update({
+                    'road_id': i,
+                    'name': f'Ward {ward_no}',
+                    'ward_number': ward_no,
+                    'Wards': f'W/{ward_no:02d}',  # Format as W/01, W/02, etc.
+                    'ward_category': 'Municipal Ward'
+                })
+                
+                roads.append(RoadFeature.model_construct(
+                    type=feature.get('type', 'Feature'),
+                    geometry=geometry,
+                    properties=properties
+                ))
         
         return roads
     
@@ -143,64 +520,363 @@ class SimpleDataService:
             'west': min_lon - lon_padding
         }
     
-    def apply_congestion_pricing(self, city: str, selected_roads: List[int], pricing_intensity: float) -> PolicyResponse:
-        """Apply congestion pricing policy and calculate projected emissions"""
+    def get_ward_overlap(self, city: str) -> WardOverlap:
+        """Get the ward x grid-cell overlap matrix, computed once and cached on disk"""
+        dataset = self.load_dataset(city)
+        return dataset.memo('ward_overlap', lambda: self._load_ward_overlap(dataset))
+    
+    def _load_ward_overlap(self, dataset: CityDataset) -> WardOverlap:
+        """Read the overlap matrix from disk, or compute and store it"""
         
-        # Load baseline data
-        baseline_data = self.load_city_data(city)
-        baseline_stats = baseline_data.baseline_stats
+        overlap_file = compiled_format.compiled_dir(self.data_dir, dataset.city) / OVERLAP_FILENAME
+        overlap = WardOverlap.load(overlap_file, dataset.source_stat, DEFAULT_SAMPLES)
+        if overlap is not None:
+            return overlap
         
-        # Calculate reduction based on pricing intensity and affected roads
-        # Assume linear relationship: 50% pricing intensity on 100% roads = 25% reduction
-        road_coverage = len(selected_roads) / len(baseline_data.roads) if baseline_data.roads else 0.1
+        features = dataset.features
+        with phase('ward_overlap'):
+            overlap = WardOverlap.compute(features, dataset.lat, dataset.lon, DEFAULT_SAMPLES)
+        try:
+            overlap.save(overlap_file, dataset.source_stat, DEFAULT_SAMPLES)
+        except OSError:
+            # Read-only data directory, keep the matrix in memory only
+            pass
+        return overlap
+    
+    def _cell_coverage(self, dataset: CityDataset, overlap: WardOverlap, selected_roads: List[int]) -> np.ndarray:
+        """Fraction of each grid cell covered by the selected wards"""
         
-        # Base reduction rates per pollutant (at 100% intensity, 100% coverage)
-        base_reductions = {
-            'co2': 0.30,    # 30% max reduction for CO2
-            'nox': 0.35,    # 35% max reduction for NOx
-            'pm25': 0.40,   # 40% max reduction for PM2.5
-        }
+        if len(overlap.cells):
+            return overlap.coverage(selected_roads)
         
-        # Calculate actual reductions
-        actual_reductions = {}
-        for pollutant, base_rate in base_reductions.items():
-            reduction = base_rate * (pricing_intensity / 100) * road_coverage
-            actual_reductions[pollutant] = min(reduction, 0.5)  # Cap at 50% reduction
-        
-        # Calculate projected emissions
-        projected_stats = EmissionStats(
-            co2=baseline_stats.co2 * (1 - actual_reductions['co2']),
-            nox=baseline_stats.nox * (1 - actual_reductions['nox']),
-            pm25=baseline_stats.pm25 * (1 - actual_reductions['pm25']),
-            total=baseline_stats.total * (1 - actual_reductions['co2'])  # Use CO2 reduction for total
-        )
+        # No ward geometry to place the policy: spread the road coverage ratio over the grid
+        road_count = sum(1 for feature in dataset.features if feature.get('geometry'))
+        road_coverage = len(selected_roads) / road_count if road_count else 0.1
+        return np.full(overlap.n_cells, min(road_coverage, 1.0))
+    
+    def apply_congestion_pricing(self, city: str, selected_roads: List[int], pricing_intensity: float,
+                                 include_grid: bool = False) -> PolicyResponse:
+        """Apply congestion pricing policy and calculate projected emissions
         
-        # Calculate percentage reductions
-        reduction_percentage = {
-            'co2': actual_reductions['co2'] * 100,
-            'nox': actual_reductions['nox'] * 100,
-            'pm25': actual_reductions['pm25'] * 100,
-            'total': actual_reductions['co2'] * 100
-        }
+        Each grid cell is reduced in proportion to the share of it covered by the
+        selected wards, so the outcome depends on where the emissions are.
+        """
         
-        # Estimate cost savings (simplified calculation)
-        # Assume $50 per ton of CO2, $100 per ton of NOx, $200 per ton of PM2.5
-        co2_savings = (baseline_stats.co2 - projected_stats.co2) * 50
-        nox_savings = (baseline_stats.nox - projected_stats.nox) * 100
-        pm25_savings = (baseline_stats.pm25 - projected_stats.pm25) * 200
-        estimated_cost_savings = co2_savings + nox_savings + pm25_savings
+        dataset = self.load_dataset(city)
+        baseline_stats = self._baseline_stats(dataset)
+        overlap = self.get_ward_overlap(city)
+        
+        with phase('policy'):
+            coverage = self._cell_coverage(dataset, overlap, selected_roads)
+            intensity = pricing_intensity / 100
+            
+            # Emissions removed from every cell, per pollutant
+            cell_reductions = {}
+            for pollutant, base_rate in BASE_REDUCTIONS.items():
+                rate = np.minimum(base_rate * intensity * coverage, MAX_REDUCTION)
+                cell_reductions[pollutant] = dataset.grids[pollutant].ravel() * rate
+            
+            reduced = {pollutant: float(values.sum()) for pollutant, values in cell_reductions.items()}
+            projected_stats = self._projected_stats(baseline_stats, reduced)
+            
+            # Attribute the removed emissions to the wards that caused them
+            wards = [w for w in dict.fromkeys(selected_roads) if 0 <= w < overlap.n_wards]
+            per_ward = {pollutant: overlap.attribute(wards, values) for pollutant, values in cell_reductions.items()}
+            ward_reductions = {
+                ward: EmissionStats.model_construct(
+                    co2=float(per_ward['co2'][i]),
+                    nox=float(per_ward['nox'][i]),
+                    pm25=float(per_ward['pm25'][i]),
+                    total=float(per_ward['co2'][i] + per_ward['nox'][i] + per_ward['pm25'][i])
+                )
+                for i, ward in enumerate(wards)
+            }
+            
+            projected_grid = None
+            if include_grid:
+                projected_grid = {
+                    pollutant: (dataset.grids[pollutant].ravel() - values).reshape(dataset.grid_shape).tolist()
+                    for pollutant, values in cell_reductions.items()
+                }
         
-        return PolicyResponse(
+        return PolicyResponse.model_construct(
             city=city,
             baseline_stats=baseline_stats,
             projected_stats=projected_stats,
-            reduction_percentage=reduction_percentage,
+            reduction_percentage=self._reduction_percentage(baseline_stats, projected_stats),
             affected_roads=selected_roads,
             pricing_intensity=pricing_intensity,
-            estimated_cost_savings=float(estimated_cost_savings)
+            estimated_cost_savings=self._cost_savings(reduced),
+            ward_reductions=ward_reductions,
+            projected_grid=projected_grid
+        )
+    
+    def sweep_congestion_pricing(self, city: str, ward_sets: List[List[int]], set_index: List[int],
+                                 intensities: List[float]) -> PolicySweepResponse:
+        """Evaluate many policies at once: scenario n prices ward_sets[set_index[n]] at intensities[n]"""
+        
+        if len(set_index) != len(intensities):
+            raise ValueError("set_index and intensities must have the same length")
+        if len(intensities) > MAX_SWEEP_SCENARIOS:
+            raise ValueError(f"At most {MAX_SWEEP_SCENARIOS} scenarios can be evaluated at once")
+        if any(not 0 <= i <= 100 for i in intensities):
+            raise ValueError("Pricing intensities must be between 0 and 100")
+        
+        dataset = self.load_dataset(city)
+        baseline_stats = self._baseline_stats(dataset)
+        overlap = self.get_ward_overlap(city)
+        
+        pollutants = list(BASE_REDUCTIONS)
+        rates = np.array([BASE_REDUCTIONS[p] for p in pollutants])
+        values = self._grid_matrix(dataset)
+        
+        with phase('policy'):
+            set_index = np.asarray(set_index, dtype=np.int64)
+            intensity = np.asarray(intensities, dtype=np.float64) / 100
+            
+            # Coverage is at most 1 and intensity at most 100%, so rates * intensity * coverage stays
+            # below MAX_REDUCTION and reductions are linear in coverage: one coverage-weighted total
+            # per ward selection, without keeping the coverage around
+            weighted = np.array([self._cell_coverage(dataset, overlap, wards) @ values for wards in ward_sets]) \
+                if ward_sets else np.zeros((0, len(pollutants)))
+            reduced = intensity[:, None] * rates[None, :] * weighted[set_index] \
+                if len(intensity) else np.zeros((0, len(pollutants)))
+            
+            baseline = np.array([getattr(baseline_stats, p) for p in pollutants])
+            projected = baseline[None, :] - reduced
+            projected_total = projected.sum(axis=1)
+            
+            projected_columns = {p: projected[:, i].tolist() for i, p in enumerate(pollutants)}
+            projected_columns['total'] = projected_total.tolist()
+            
+            reduction_percentage = {}
+            for i, p in enumerate(pollutants):
+                reduction_percentage[p] = (reduced[:, i] / baseline[i] * 100 if baseline[i] else np.zeros(len(reduced))).tolist()
+            reduction_percentage['total'] = ((baseline_stats.total - projected_total) / baseline_stats.total * 100
+                                             if baseline_stats.total else np.zeros(len(reduced))).tolist()
+            
+            costs = np.array([COST_PER_TON[p] for p in pollutants], dtype=np.float64)
+        
+        return PolicySweepResponse.model_construct(
+            city=city,
+            baseline_stats=baseline_stats,
+            scenario_count=len(intensity),
+            ward_sets=ward_sets,
+            ward_set_index=set_index.tolist(),
+            pricing_intensity=list(intensities),
+            projected=projected_columns,
+            reduction_percentage=reduction_percentage,
+            estimated_cost_savings=(reduced @ costs).tolist()
+        )
+    
+    def open_policy_session(self, city: str, selected_roads: List[int], pricing_intensity: float) -> PolicySession:
+        """Start an interactive policy session with the given wards selected"""
+        
+        dataset = self.load_dataset(city)
+        overlap = self.get_ward_overlap(city)
+        if not len(overlap.cells):
+            raise ValueError(f"City {city} has no ward geometry to update policies incrementally")
+        
+        rates = np.array(list(BASE_REDUCTIONS.values()))
+        session = PolicySession(overlap, self._grid_matrix(dataset), rates, MAX_REDUCTION, pricing_intensity)
+        session.update(add=selected_roads)
+        return session
+    
+    def policy_session_state(self, city: str, session: PolicySession,
+                             wards: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+        """Totals of a session plus the reductions of the given wards (all selected wards by default)"""
+        
+        baseline_stats = self._baseline_stats(self.load_dataset(city))
+        with phase('policy'):
+            reduced = dict(zip(BASE_REDUCTIONS, session.reduced().tolist()))
+            projected_stats = self._projected_stats(baseline_stats, reduced)
+            ward_reductions = {}
+            for ward, values in session.ward_reductions(session.selected if wards is None else wards).items():
+                co2, nox, pm25 = values.tolist()
+                ward_reductions[ward] = {'co2': co2, 'nox': nox, 'pm25': pm25, 'total': co2 + nox + pm25}
+        
+        return {
+            'projected_stats': projected_stats.model_dump(),
+            'reduction_percentage': self._reduction_percentage(baseline_stats, projected_stats),
+            'pricing_intensity': session.pricing_intensity,
+            'estimated_cost_savings': self._cost_savings(reduced),
+            'ward_reductions': ward_reductions,
+        }
+    
+    def _ward_road_lengths(self, dataset: CityDataset, overlap: WardOverlap) -> Optional[np.ndarray]:
+        """Approximate road length per ward (km), None if the city's road length is unknown
+        
+        The source data only has the road length of the whole city, so it is split
+        by ward area, assuming the same road density everywhere.
+        """
+        road_length = float(dataset.static_info.get('road_length_km') or 0)
+        area = overlap.aggregate(np.ones(overlap.n_cells))
+        if road_length <= 0 or not area.sum():
+            return None
+        return road_length * area / area.sum()
+    
+    def optimize_wards(self, city: str, pollutant: str, target_reduction: float, pricing_intensity: float,
+                       objective: str = 'wards', method: str = 'greedy') -> WardOptimizationResponse:
+        """Choose the wards to price for a reduction target at the least number of wards or road length
+        
+        The greedy search adds the ward removing the most emissions per unit of
+        cost until the target is met. The exact method solves the knapsack on the
+        per-ward reductions and tops the result up greedily where overlapping
+        wards make the reductions less than additive.
+        """
+        
+        dataset = self.load_dataset(city)
+        baseline_stats = self._baseline_stats(dataset)
+        overlap = self.get_ward_overlap(city)
+        if not len(overlap.cells):
+            raise ValueError(f"City {city} has no ward geometry to select wards from")
+        
+        # Pricing intensity is at most 100%, so the reduction cap never binds and a cell
+        # removes its weighted emissions times its covered fraction
+        rates = np.array([BASE_REDUCTIONS[p] if pollutant in (p, 'total') else 0.0 for p in BASE_REDUCTIONS])
+        cell_gain = self._grid_matrix(dataset) @ (rates * pricing_intensity / 100)
+        baseline = getattr(baseline_stats, pollutant)
+        target = baseline * target_reduction / 100
+        
+        road_lengths = self._ward_road_lengths(dataset, overlap)
+        if objective == 'road_length':
+            if road_lengths is None:
+                raise ValueError(f"City {city} has no road length to optimize for")
+            # Keep wards without area (and so without emissions) from dividing by zero
+            costs = np.maximum(road_lengths, 1e-9)
+        else:
+            costs = np.ones(overlap.n_wards)
+        
+        with phase('optimize'):
+            if method == 'exact':
+                resolution = ROAD_LENGTH_STEP_KM if objective == 'road_length' else 1.0
+                selected = ward_optimizer.knapsack_select(overlap.aggregate(cell_gain), costs, target, resolution)
+                if selected is None:
+                    raise ValueError(f"City {city} has too many wards for the exact method, use method 'greedy'")
+                selected, achieved = ward_optimizer.greedy_select(overlap, cell_gain, costs, target, initial=selected)
+            else:
+                selected, achieved = ward_optimizer.greedy_select(overlap, cell_gain, costs, target)
+        
+        policy = self.apply_congestion_pricing(city, selected, pricing_intensity)
+        
+        return WardOptimizationResponse.model_construct(
+            city=city,
+            pollutant=pollutant,
+            target_reduction=target_reduction,
+            objective=objective,
+            method=method,
+            selected_roads=selected,
+            ward_count=len(selected),
+            road_length_km=float(road_lengths[selected].sum()) if road_lengths is not None else 0.0,
+            achieved_reduction=policy.reduction_percentage[pollutant],
+            target_met=achieved >= target * (1 - 1e-9),
+            policy=policy
+        )
+    
+    def _grid_matrix(self, dataset: CityDataset) -> np.ndarray:
+        """Emission grids as one (cells x pollutants) matrix, in BASE_REDUCTIONS order"""
+        return dataset.grid_matrix
+    
+    def _projected_stats(self, baseline_stats: EmissionStats, reduced: Dict[str, float]) -> EmissionStats:
+        """Subtract reduced tons from the baseline"""
+        co2 = baseline_stats.co2 - reduced['co2']
+        nox = baseline_stats.nox - reduced['nox']
+        pm25 = baseline_stats.pm25 - reduced['pm25']
+        return EmissionStats(co2=co2, nox=nox, pm25=pm25, total=co2 + nox + pm25)
+    
+    def _reduction_percentage(self, baseline_stats: EmissionStats, projected_stats: EmissionStats) -> Dict[str, float]:
+        """Percentage reduction by pollutant and in total"""
+        reduction_percentage = {}
+        for pollutant in ('co2', 'nox', 'pm25', 'total'):
+            baseline = getattr(baseline_stats, pollutant)
+            projected = getattr(projected_stats, pollutant)
+            reduction_percentage[pollutant] = (baseline - projected) / baseline * 100 if baseline else 0.0
+        return reduction_percentage
+    
+    def _cost_savings(self, reduced: Dict[str, float]) -> float:
+        """Estimate cost savings (simplified damage cost per ton)"""
+        return float(sum(reduced[pollutant] * cost for pollutant, cost in COST_PER_TON.items()))
+    
+    def get_spatial_index(self, city: str) -> SpatialIndex:
+        """Point and bbox index over the wards and grid cells, built on first use"""
+        dataset = self.load_dataset(city)
+        overlap = self.get_ward_overlap(city)
+        return dataset.memo('spatial_index', lambda: SpatialIndex(
+            dataset.features, dataset.lat, dataset.lon, self._grid_matrix(dataset), overlap))
+    
+    def lookup_point(self, city: str, lat: float, lon: float) -> PointLookupResponse:
+        """Ward and grid cell under a point, with their emissions"""
+        
+        index = self.get_spatial_index(city)
+        ward = index.ward_at(lat, lon)
+        cell = index.cell_at(lat, lon)
+        grid_cell = None
+        if cell is not None:
+            row, col = cell
+            co2, nox, pm25 = index.cell_values(row, col).tolist()
+            grid_cell = GridCell.model_construct(lat=float(index.lat[row]), lon=float(index.lon[col]),
+                                                 co2=co2, nox=nox, pm25=pm25, row=row, col=col)
+        
+        return PointLookupResponse.model_construct(
+            city=city,
+            lat=lat,
+            lon=lon,
+            ward=self._ward_summary(index, ward) if ward is not None else None,
+            cell=grid_cell
+        )
+    
+    def query_bbox(self, city: str, bbox: Sequence[float]) -> BBoxQueryResponse:
+        """Wards and grid cells within a west/south/east/north bbox"""
+        
+        index = self.get_spatial_index(city)
+        rows, cols = index.cells_in_bbox(*bbox)
+        cells = (rows[:, None] * len(index.lon) + cols[None, :]).ravel()
+        values = index.values[cells].reshape(len(rows), len(cols), -1)
+        
+        return BBoxQueryResponse.model_construct(
+            city=city,
+            bbox=list(bbox),
+            wards=[self._ward_summary(index, int(ward)) for ward in index.wards_in_bbox(*bbox)],
+            coordinates={'latitudes': index.lat[rows].tolist(), 'longitudes': index.lon[cols].tolist()},
+            grids={pollutant: values[:, :, i].tolist() for i, pollutant in enumerate(BASE_REDUCTIONS)}
+        )
+    
+    def get_city_analytics(self, city: str, k: int = 10, bins: int = 20) -> Dict[str, Any]:
+        """Top-k hotspot cells, percentiles, histogram and ward aggregates of every pollutant
+        
+        Sorted cell values, percentiles and ward aggregates are memoized per
+        city; hotspots and histograms depend on k and bins and are derived per call.
+        """
+        
+        dataset = self.load_dataset(city)
+        overlap = self.get_ward_overlap(city)
+        
+        def profiles():
+            values = self._grid_matrix(dataset)
+            with phase('analytics'):
+                return {pollutant: pollutant_profile(values[:, i], overlap)
+                        for i, pollutant in enumerate(BASE_REDUCTIONS)}
+        
+        profile = dataset.memo('analytics_profile', profiles)
+        with phase('analytics'):
+            pollutants = grid_analytics(profile, dataset.lat, dataset.lon, k, bins)
+        return {
+            'city': city,
+            'grid_shape': list(dataset.grid_shape),
+            'ward_count': overlap.n_wards,
+            'pollutants': pollutants,
+        }
+    
+    def _ward_summary(self, index: SpatialIndex, ward: int) -> WardSummary:
+        co2, nox, pm25 = index.ward_emissions[ward].tolist()
+        ward_number = index.ward_numbers[ward]
+        return WardSummary.model_construct(
+            ward=ward,
+            ward_number=ward_number,
+            name=f'Ward {ward_number}',
+            emissions=EmissionStats.model_construct(co2=co2, nox=nox, pm25=pm25, total=co2 + nox + pm25)
         )
     
     def get_emission_stats(self, city: str) -> EmissionStats:
         """Get emission statistics for a city"""
-        city_data = self.load_city_data(city)
-        return city_data.baseline_stats
+        return self._baseline_stats(self.load_dataset(city))
@@ -0,0 +1,106 @@
+# Spatial index over the wards and the emission grid of a city
+#
+# Grid cells are found from the regular lat/lon axes by binary search. Wards
+# are narrowed down by their bounding boxes and then tested exactly against
+# their polygon edges (even-odd rule), which are kept as flat arrays so a
+# lookup never touches the GeoJSON.
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.geometry_lod import feature_bboxes
+from services.ward_overlap import WardOverlap, feature_polygons, half_cell
+
+
+def _nearest(axis: np.ndarray, half: float, value: float) -> Optional[int]:
+    """Index of the axis cell containing value, or None outside the grid"""
+    if len(axis) == 0:
+        return None
+    i = int(np.searchsorted(axis, value))
+    candidates = [k for k in (i - 1, i) if 0 <= k < len(axis)]
+    best = min(candidates, key=lambda k: abs(axis[k] - value))
+    return best if abs(axis[best] - value) <= half else None
+
+
+class SpatialIndex:
+    """Point and bbox queries over ward polygons and grid cells, with per-ward emissions"""
+
+    def __init__(self, features: Sequence[Dict[str, Any]], lat: np.ndarray, lon: np.ndarray,
+                 values: np.ndarray, overlap: WardOverlap):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.h_lat, self.h_lon = half_cell(self.lat), half_cell(self.lon)
+        # Emissions per cell and pollutant, (cells x pollutants)
+        self.values = values
+        self.boxes = feature_bboxes(list(features))
+        self.ward_numbers = [(feature.get('properties') or {}).get('Ward_No.', i + 1)
+                             for i, feature in enumerate(features)]
+
+        # Polygon edges of every ward, ward w owning edges edge_indptr[w]:edge_indptr[w + 1]
+        edges: List[np.ndarray] = []
+        polygon_ids: List[np.ndarray] = []
+        indptr = [0]
+        for feature in features:
+            count = 0
+            for p, rings in enumerate(feature_polygons(feature.get('geometry'))):
+                for ring in rings:
+                    edges.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+                    polygon_ids.append(np.full(len(ring), p, dtype=np.int32))
+                    count += len(ring)
+            indptr.append(indptr[-1] + count)
+        self.edge_indptr = np.asarray(indptr, dtype=np.int64)
+        self.edges = np.concatenate(edges) if edges else np.zeros((0, 4))
+        self.edge_polygons = np.concatenate(polygon_ids) if polygon_ids else np.zeros(0, dtype=np.int32)
+
+        # Emissions inside each ward: overlap fraction times cell value, (wards x pollutants)
+        self.ward_emissions = np.stack([overlap.aggregate(values[:, p]) for p in range(values.shape[1])], axis=1)
+
+    @property
+    def n_wards(self) -> int:
+        return len(self.boxes)
+
+    def cell_at(self, lat: float, lon: float) -> Optional[Tuple[int, int]]:
+        """Row and column of the grid cell containing the point"""
+        row = _nearest(self.lat, self.h_lat, lat)
+        col = _nearest(self.lon, self.h_lon, lon)
+        if row is None or col is None:
+            return None
+        return row, col
+
+    def contains(self, ward: int, lat: float, lon: float) -> bool:
+        """Exact point-in-polygon test against one ward (holes and multipolygons included)"""
+        start, end = self.edge_indptr[ward], self.edge_indptr[ward + 1]
+        if start == end:
+            return False
+        x1, y1, x2, y2 = self.edges[start:end].T
+        straddles = (y1 > lat) != (y2 > lat)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+        crossings = self.edge_polygons[start:end][straddles & (lon < x_cross)]
+        return bool(np.any(np.bincount(crossings) % 2))
+
+    def ward_at(self, lat: float, lon: float) -> Optional[int]:
+        """First ward whose polygon contains the point"""
+        with np.errstate(invalid='ignore'):
+            candidates = np.nonzero((self.boxes[:, 0] <= lon) & (self.boxes[:, 2] >= lon) &
+                                    (self.boxes[:, 1] <= lat) & (self.boxes[:, 3] >= lat))[0]
+        for ward in candidates:
+            if self.contains(int(ward), lat, lon):
+                return int(ward)
+        return None
+
+    def wards_in_bbox(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """Wards whose bounding box intersects the given one"""
+        with np.errstate(invalid='ignore'):
+            hit = ((self.boxes[:, 0] <= east) & (self.boxes[:, 2] >= west) &
+                   (self.boxes[:, 1] <= north) & (self.boxes[:, 3] >= south))
+        return np.nonzero(hit)[0]
+
+    def cells_in_bbox(self, west: float, south: float, east: float, north: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and columns of the grid cells overlapping the bbox"""
+        rows = np.nonzero((self.lat + self.h_lat >= south) & (self.lat - self.h_lat <= north))[0]
+        cols = np.nonzero((self.lon + self.h_lon >= west) & (self.lon - self.h_lon <= east))[0]
+        return rows, cols
+
+    def cell_values(self, row: int, col: int) -> np.ndarray:
+        return self.values[row * len(self.lon) + col]
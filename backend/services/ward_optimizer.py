@@ -0,0 +1,102 @@
+# Ward selection for a reduction target
+#
+# Pricing ward w removes gain(w) = sum over its cells of u_c * (min(raw_c + o_wc, 1) - min(raw_c, 1)),
+# where raw is the coverage of the wards already selected and u the reduction of a fully
+# covered cell. Coverage is capped at 1, so gains only shrink as wards are added
+# (diminishing returns) and a lazy greedy search over a heap stays close to optimal. Where wards
+# do not overlap the gains are additive, which the knapsack mode uses to solve the
+# problem exactly on integer costs.
+import heapq
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from services.ward_overlap import WardOverlap
+
+# Largest knapsack table (wards x cost steps) solved exactly
+MAX_KNAPSACK_CELLS = 20_000_000
+
+
+def _gain(overlap: WardOverlap, raw: np.ndarray, cell_gain: np.ndarray, ward: int) -> float:
+    cells, weights = overlap.ward_entries(ward)
+    covered = raw[cells]
+    return float(cell_gain[cells] @ (np.minimum(covered + weights, 1.0) - np.minimum(covered, 1.0)))
+
+
+def coverage_gain(overlap: WardOverlap, cell_gain: np.ndarray, wards: Iterable[int]) -> float:
+    """Reduction of a ward selection: cell gains weighted by the capped coverage"""
+    return float(cell_gain @ overlap.coverage(list(wards)))
+
+
+def greedy_select(overlap: WardOverlap, cell_gain: np.ndarray, costs: np.ndarray, target: float,
+                  initial: Iterable[int] = ()) -> Tuple[List[int], float]:
+    """Add the ward with the best gain per cost until the target is reached (lazy greedy)
+
+    Returns the selection in the order it was built and its reduction. Stale heap
+    entries are re-evaluated when popped; since gains never grow, a ward whose
+    fresh gain still beats the next entry is the true best.
+    """
+    selected = list(dict.fromkeys(w for w in initial if 0 <= w < overlap.n_wards))
+    raw = overlap.raw_coverage(selected).astype(np.float64)
+    achieved = float(cell_gain @ np.minimum(raw, 1.0))
+
+    chosen = set(selected)
+    heap = []
+    initial_gains = overlap.aggregate(cell_gain)
+    for ward in range(overlap.n_wards):
+        if ward not in chosen:
+            gain = _gain(overlap, raw, cell_gain, ward) if chosen else float(initial_gains[ward])
+            if gain > 0:
+                heap.append((-gain / costs[ward], ward))
+    heapq.heapify(heap)
+
+    while achieved < target and heap:
+        _, ward = heapq.heappop(heap)
+        gain = _gain(overlap, raw, cell_gain, ward)
+        if gain <= 0:
+            continue
+        priority = -gain / costs[ward]
+        if heap and priority > heap[0][0]:
+            heapq.heappush(heap, (priority, ward))
+            continue
+        cells, weights = overlap.ward_entries(ward)
+        raw[cells] += weights
+        achieved += gain
+        selected.append(ward)
+    return selected, achieved
+
+
+def knapsack_select(gains: np.ndarray, costs: np.ndarray, target: float, resolution: float) -> Optional[List[int]]:
+    """Cheapest ward set whose additive gains reach the target, by dynamic programming over cost
+
+    Costs are rounded to multiples of resolution. Returns None when the table
+    would exceed MAX_KNAPSACK_CELLS, and every ward with a gain when the target
+    cannot be reached.
+    """
+    steps = np.maximum(np.round(costs / resolution).astype(np.int64), 1)
+    capacity = int(steps.sum())
+    if len(gains) * (capacity + 1) > MAX_KNAPSACK_CELLS:
+        return None
+
+    # best[c]: largest gain with total cost exactly c (-inf if unreachable)
+    best = np.full(capacity + 1, -np.inf)
+    best[0] = 0.0
+    taken = np.zeros((len(gains), capacity + 1), dtype=bool)
+    for i, (gain, step) in enumerate(zip(gains, steps)):
+        candidate = np.full(capacity + 1, -np.inf)
+        candidate[step:] = best[:-step] + gain
+        better = candidate > best
+        taken[i] = better
+        best = np.where(better, candidate, best)
+
+    reachable = np.nonzero(best >= target)[0]
+    if len(reachable) == 0:
+        return [int(w) for w in np.nonzero(gains > 0)[0]]
+
+    selected = []
+    c = int(reachable[0])
+    for i in range(len(gains) - 1, -1, -1):
+        if taken[i, c]:
+            selected.append(i)
+            c -= int(steps[i])
+    return sorted(selected)
@@ -0,0 +1,220 @@
+# Ward to grid-cell overlap matrix
+#
+# Row w of the matrix holds the fraction of each emission grid cell covered by
+# ward polygon w (the feature at index w of geometry.features). It is stored in
+# CSR form (indptr/cells/weights) and cached on disk next to the compiled data.
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+OVERLAP_VERSION = 1
+OVERLAP_FILENAME = "ward_overlap.npz"
+
+# Sample points per cell side used to estimate the covered fraction
+DEFAULT_SAMPLES = 8
+
+# Upper bound on scanlines x edges evaluated at once
+_SCAN_CHUNK = 4_000_000
+
+
+def feature_polygons(geometry: Optional[Dict[str, Any]]) -> List[List[np.ndarray]]:
+    """Rings of each polygon in a Polygon/MultiPolygon geometry, as (n, 2) lon/lat arrays"""
+    if not geometry:
+        return []
+    if geometry.get('type') == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry.get('type') == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return []
+
+    result = []
+    for polygon in polygons:
+        rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon if len(ring) >= 3]
+        if rings:
+            result.append(rings)
+    return result
+
+
+def lattice_in_polygons(xs: np.ndarray, ys: np.ndarray, polygons: List[List[np.ndarray]]) -> np.ndarray:
+    """Even-odd test of the lattice points (ys x xs) against the union of polygons
+
+    Each horizontal scanline is intersected with all polygon edges once; the
+    points on it are then classified by counting crossings to their left.
+    xs must be sorted.
+    """
+    inside = np.zeros((len(ys), len(xs)), dtype=bool)
+    for rings in polygons:
+        ring_edges = [(ring[:, 0], ring[:, 1], np.roll(ring[:, 0], -1), np.roll(ring[:, 1], -1)) for ring in rings]
+        x1, y1, x2, y2 = (np.concatenate(parts) for parts in zip(*ring_edges))
+
+        step = max(1, _SCAN_CHUNK // len(x1))
+        for start in range(0, len(ys), step):
+            cy = ys[start:start + step, None]
+            straddles = (y1 > cy) != (y2 > cy)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (cy - y1) * (x2 - x1) / (y2 - y1)
+            for row, (mask, crossings) in enumerate(zip(straddles, x_cross)):
+                crossings = np.sort(crossings[mask])
+                left = np.searchsorted(crossings, xs)
+                inside[start + row] |= (left % 2).astype(bool)
+    return inside
+
+
+def half_cell(axis: np.ndarray) -> float:
+    """Half the nominal spacing of a grid axis (some axes skip rows, so use the smallest step)"""
+    if len(axis) < 2:
+        return 0.0025
+    return float(np.min(np.diff(axis))) / 2
+
+
+class WardOverlap:
+    """Sparse ward x cell matrix of fractional overlaps"""
+
+    def __init__(self, indptr: np.ndarray, cells: np.ndarray, weights: np.ndarray, grid_shape: Tuple[int, int]):
+        self.indptr = indptr
+        self.cells = cells
+        self.weights = weights
+        self.grid_shape = tuple(int(n) for n in grid_shape)
+        self.n_wards = len(indptr) - 1
+        self.n_cells = self.grid_shape[0] * self.grid_shape[1]
+        # Ward index of every stored entry, for bincount-based reductions
+        self.rows = np.repeat(np.arange(self.n_wards), np.diff(indptr))
+        # Cell -> ward transpose, built on first use
+        self._cell_indptr: Optional[np.ndarray] = None
+        self._cell_wards: Optional[np.ndarray] = None
+
+    @classmethod
+    def compute(cls, features: Sequence[Dict[str, Any]], lat: np.ndarray, lon: np.ndarray,
+                samples: int = DEFAULT_SAMPLES) -> 'WardOverlap':
+        """Estimate ward/cell overlaps by sampling samples x samples points per grid cell"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        h_lat, h_lon = half_cell(lat), half_cell(lon)
+
+        # Sample offsets within a cell, in half-cell units
+        offsets = (np.arange(samples) + 0.5) / samples * 2 - 1
+
+        indptr = [0]
+        all_cells: List[np.ndarray] = []
+        all_weights: List[np.ndarray] = []
+
+        for feature in features:
+            polygons = feature_polygons(feature.get('geometry'))
+            if polygons:
+                points = np.concatenate([ring for rings in polygons for ring in rings])
+                min_lon, min_lat = points.min(axis=0)
+                max_lon, max_lat = points.max(axis=0)
+
+                # Candidate cells whose extent intersects the ward bounding box
+                i0, i1 = np.searchsorted(lat, [min_lat - h_lat, max_lat + h_lat])
+                j0, j1 = np.searchsorted(lon, [min_lon - h_lon, max_lon + h_lon])
+            else:
+                i0 = i1 = j0 = j1 = 0
+
+            if i1 > i0 and j1 > j0:
+                ys = (lat[i0:i1, None] + offsets[None, :] * h_lat).ravel()
+                xs = (lon[j0:j1, None] + offsets[None, :] * h_lon).ravel()
+                inside = lattice_in_polygons(xs, ys, polygons)
+                fraction = inside.reshape(i1 - i0, samples, j1 - j0, samples).sum(axis=(1, 3)) / (samples * samples)
+                ii, jj = np.nonzero(fraction)
+                all_cells.append(((ii + i0) * len(lon) + jj + j0).astype(np.int32))
+                all_weights.append(fraction[ii, jj].astype(np.float32))
+                indptr.append(indptr[-1] + len(ii))
+            else:
+                indptr.append(indptr[-1])
+
+        return cls(
+            indptr=np.asarray(indptr, dtype=np.int64),
+            cells=np.concatenate(all_cells) if all_cells else np.zeros(0, dtype=np.int32),
+            weights=np.concatenate(all_weights) if all_weights else np.zeros(0, dtype=np.float32),
+            grid_shape=(len(lat), len(lon)),
+        )
+
+    def _select(self, wards: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Entry positions of the given wards and the local ward number of each entry"""
+        wards = np.asarray([w for w in wards if 0 <= w < self.n_wards], dtype=np.int64)
+        if len(wards) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        starts, ends = self.indptr[wards], self.indptr[wards + 1]
+        lengths = ends - starts
+        local = np.repeat(np.arange(len(wards)), lengths)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return positions, local
+
+    def ward_entries(self, ward: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Cells and overlap weights of one ward"""
+        start, end = self.indptr[ward], self.indptr[ward + 1]
+        return self.cells[start:end], self.weights[start:end]
+
+    def wards_touching(self, cells: np.ndarray) -> np.ndarray:
+        """Wards that overlap any of the given cells"""
+        if self._cell_indptr is None:
+            order = np.argsort(self.cells, kind='stable')
+            self._cell_wards = self.rows[order]
+            self._cell_indptr = np.concatenate([[0], np.cumsum(np.bincount(self.cells, minlength=self.n_cells))])
+        starts, ends = self._cell_indptr[cells], self._cell_indptr[cells + 1]
+        lengths = ends - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self._cell_wards[positions])
+
+    def aggregate(self, cell_values: np.ndarray) -> np.ndarray:
+        """Sum of cell values inside every ward, each cell weighted by its overlap"""
+        return np.bincount(self.rows, weights=self.weights * cell_values[self.cells], minlength=self.n_wards)
+
+    def raw_coverage(self, wards: Iterable[int]) -> np.ndarray:
+        """Summed overlap of the selected wards per cell (may exceed 1 where wards overlap)"""
+        positions, _ = self._select(wards)
+        return np.bincount(self.cells[positions], weights=self.weights[positions], minlength=self.n_cells)
+
+    def coverage(self, wards: Iterable[int]) -> np.ndarray:
+        """Fraction of each cell covered by the selected wards"""
+        return np.minimum(self.raw_coverage(wards), 1.0)
+
+    def ward_totals(self, grid: np.ndarray) -> np.ndarray:
+        """Emissions attributed to every ward (area-weighted sum over its cells)"""
+        values = np.asarray(grid, dtype=np.float64).ravel()[self.cells] * self.weights
+        return np.bincount(self.rows, weights=values, minlength=self.n_wards)
+
+    def attribute(self, wards: Sequence[int], cell_values: np.ndarray) -> np.ndarray:
+        """Split per-cell values over the selected wards in proportion to their overlap"""
+        wards = [w for w in wards if 0 <= w < self.n_wards]
+        positions, local = self._select(wards)
+        cells = self.cells[positions]
+        raw = np.bincount(cells, weights=self.weights[positions], minlength=self.n_cells)
+        # Shares of a cell sum to 1, so the ward values add up to the cell totals
+        share = self.weights[positions] / raw[cells]
+        return np.bincount(local, weights=share * cell_values[cells], minlength=len(wards))
+
+    def save(self, path: Path, source: Dict[str, Any], samples: int) -> None:
+        """Write the matrix to an .npz file tagged with the source fingerprint"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(
+            tmp_path,
+            version=OVERLAP_VERSION,
+            samples=samples,
+            source_mtime_ns=source['mtime_ns'],
+            source_size=source['size'],
+            indptr=self.indptr,
+            cells=self.cells,
+            weights=self.weights,
+            grid_shape=np.asarray(self.grid_shape),
+        )
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Path, source: Dict[str, Any], samples: int) -> Optional['WardOverlap']:
+        """Read a cached matrix, or None if it is missing or was built from other data"""
+        try:
+            with np.load(path) as f:
+                if (int(f['version']) != OVERLAP_VERSION or int(f['samples']) != samples
+                        or int(f['source_mtime_ns']) != source['mtime_ns']
+                        or int(f['source_size']) != source['size']):
+                    return None
+                return cls(f['indptr'], f['cells'], f['weights'], tuple(f['grid_shape']))
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,26 @@
+# Shared fixtures: tests run from backend/ against the cities in data/
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BACKEND_DIR.parent / "data"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from services.simple_data_service import SimpleDataService  # noqa: E402
+
+# A small city with ward geometry (19 wards on a 15 x 8 grid)
+SMALL_CITY = "kohima"
+
+
+@pytest.fixture(scope="session")
+def data_service() -> SimpleDataService:
+    return SimpleDataService(str(DATA_DIR))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    return TestClient(main.app)
@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import SMALL_CITY
+from services.geometry_lod import LOD_LEVELS, MAX_LOD, lod_geometries
+
+
+def rings(geometry):
+    if not geometry:
+        return []
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    return [ring for polygon in polygons for ring in polygon]
+
+
+def edges(geometry, decimals=None):
+    """Undirected edges of a geometry, with coordinates rounded to decimals"""
+    result = set()
+    for ring in rings(geometry):
+        points = [(x, y) if decimals is None else (round(x, decimals), round(y, decimals)) for x, y, *_ in ring]
+        result.update(frozenset(edge) for edge in zip(points, points[1:]) if edge[0] != edge[1])
+    return result
+
+
+def shared_borders(geometries):
+    """(a, b) -> vertices of the edges wards a and b share in the source geometry"""
+    owners = {}
+    for ward, geometry in enumerate(geometries):
+        for edge in edges(geometry):
+            owners.setdefault(edge, []).append(ward)
+    borders = {}
+    for edge, wards in owners.items():
+        for i, a in enumerate(wards):
+            for b in wards[i + 1:]:
+                borders.setdefault((a, b), set()).update(edge)
+    return borders
+
+
+def zigzag_wards():
+    # Two wards sharing a jagged border that every LOD simplifies
+    border = [[0.01 + (0.00005 if i % 2 else 0), i * 0.001] for i in range(21)]
+    west = [[0.0, 0.0]] + border + [[0.0, 0.02], [0.0, 0.0]]
+    east = [[0.01, 0.0], [0.02, 0.0], [0.02, 0.02]] + border[::-1]
+    return [{'geometry': {'type': 'Polygon', 'coordinates': [west]}},
+            {'geometry': {'type': 'Polygon', 'coordinates': [east]}}]
+
+
+@pytest.fixture(scope="module")
+def city_features(data_service):
+    return data_service.load_dataset(SMALL_CITY).features
+
+
+@pytest.mark.parametrize("lod", range(1, MAX_LOD + 1))
+@pytest.mark.parametrize("source", ["zigzag", "city"])
+def test_shared_borders_stay_identical(request, source, lod):
+    features = zigzag_wards() if source == "zigzag" else request.getfixturevalue("city_features")
+    borders = shared_borders([feature.get('geometry') for feature in features])
+    assert borders
+
+    decimals = LOD_LEVELS[lod]['decimals']
+    simplified = [edges(geometry) for geometry in lod_geometries(features, lod)]
+    for (a, b), vertices in borders.items():
+        border = {(round(x, decimals), round(y, decimals)) for x, y in vertices}
+        # Simplified edges along the source border, seen from either side
+        side_a = {edge for edge in simplified[a] if edge <= border}
+        side_b = {edge for edge in simplified[b] if edge <= border}
+        assert side_a == side_b, (a, b)
+        if source == "zigzag":
+            assert 0 < len(side_a) < len(vertices) - 1
@@ -0,0 +1,54 @@
+import pytest
+
+from conftest import SMALL_CITY
+
+# (op, wards or intensity) applied in order to one session
+STEPS = [
+    ('add', [0, 1, 2]),
+    ('intensity', 35.0),
+    ('add', [7, 8]),
+    ('remove', [1]),
+    ('intensity', 100.0),
+    ('add', [1, 12, 18]),
+    ('remove', [0, 7, 18]),
+    ('intensity', 0.0),
+    ('intensity', 62.5),
+    ('remove', [2, 8, 12, 1]),
+    ('add', [3]),
+]
+
+
+def assert_matches_policy(data_service, session):
+    state = data_service.policy_session_state(SMALL_CITY, session)
+    policy = data_service.apply_congestion_pricing(SMALL_CITY, sorted(session.selected), session.pricing_intensity)
+
+    for pollutant in ('co2', 'nox', 'pm25', 'total'):
+        assert state['projected_stats'][pollutant] == pytest.approx(getattr(policy.projected_stats, pollutant))
+        assert state['reduction_percentage'][pollutant] == pytest.approx(policy.reduction_percentage[pollutant],
+                                                                         abs=1e-9)
+    assert sorted(state['ward_reductions']) == sorted(policy.ward_reductions)
+    for ward, expected in policy.ward_reductions.items():
+        for pollutant in ('co2', 'nox', 'pm25', 'total'):
+            assert state['ward_reductions'][ward][pollutant] == pytest.approx(getattr(expected, pollutant),
+                                                                              abs=1e-9)
+
+
+def test_session_matches_apply_policy_after_each_step(data_service):
+    session = data_service.open_policy_session(SMALL_CITY, [], 50.0)
+    assert_matches_policy(data_service, session)
+
+    for op, value in STEPS:
+        if op == 'add':
+            session.update(add=value)
+        elif op == 'remove':
+            session.update(remove=value)
+        else:
+            session.set_intensity(value)
+        assert_matches_policy(data_service, session)
+
+
+def test_session_rejects_intensity_out_of_range(data_service):
+    session = data_service.open_policy_session(SMALL_CITY, [0], 50.0)
+    with pytest.raises(ValueError):
+        session.set_intensity(120.0)
+    assert session.pricing_intensity == 50.0
@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import SMALL_CITY
+
+
+def test_sweep_matches_single_policies(data_service):
+    ward_sets = [[0, 1, 5], [2, 3], []]
+    set_index = [0, 0, 1, 1, 2, 0]
+    intensities = [0.0, 100.0, 35.0, 70.0, 50.0, 12.5]
+    sweep = data_service.sweep_congestion_pricing(SMALL_CITY, ward_sets, set_index, intensities)
+
+    assert sweep.scenario_count == len(intensities)
+    for n, (index, intensity) in enumerate(zip(set_index, intensities)):
+        policy = data_service.apply_congestion_pricing(SMALL_CITY, ward_sets[index], intensity)
+        for pollutant in ('co2', 'nox', 'pm25', 'total'):
+            assert sweep.projected[pollutant][n] == pytest.approx(getattr(policy.projected_stats, pollutant))
+            assert sweep.reduction_percentage[pollutant][n] == pytest.approx(policy.reduction_percentage[pollutant])
+        assert sweep.estimated_cost_savings[n] == pytest.approx(policy.estimated_cost_savings)
+
+
+def test_sweep_rejects_intensities_out_of_range(data_service):
+    with pytest.raises(ValueError):
+        data_service.sweep_congestion_pricing(SMALL_CITY, [[0]], [0], [150.0])
+
+
+@pytest.mark.parametrize("body", [
+    {"ward_sets": [[0, 1]]},
+    {"intensities": {"start": 0, "stop": 100, "num": 3}},
+])
+def test_batch_requires_intensities_with_ward_sets(client, body):
+    response = client.post('/apply_policy/batch', json={"city": SMALL_CITY, **body})
+    assert response.status_code == 400
+
+
+def test_batch_expands_intensities_by_ward_sets(client):
+    response = client.post('/apply_policy/batch', json={
+        "city": SMALL_CITY,
+        "scenarios": [{"selected_roads": [4], "pricing_intensity": 80}],
+        "intensities": {"start": 0, "stop": 100, "num": 5},
+        "ward_sets": [[0, 1], [2]],
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["scenario_count"] == 11
+    assert data["pricing_intensity"] == [80, 0, 25, 50, 75, 100, 0, 25, 50, 75, 100]
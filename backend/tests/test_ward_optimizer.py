@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from conftest import SMALL_CITY
+from services import ward_optimizer
+from services.ward_overlap import WardOverlap
+
+
+def brute_force_cost(gains, costs, target):
+    """Least total cost of a ward set whose gains reach the target, trying every subset"""
+    subset_gains = subset_costs = np.zeros(1)
+    for gain, cost in zip(gains, costs):
+        subset_gains = np.concatenate([subset_gains, subset_gains + gain])
+        subset_costs = np.concatenate([subset_costs, subset_costs + cost])
+    return subset_costs[subset_gains >= target].min()
+
+
+def disjoint_overlap(n_wards):
+    # Every ward covers one cell of its own, so gains are additive
+    return WardOverlap(np.arange(n_wards + 1), np.arange(n_wards, dtype=np.int32),
+                       np.ones(n_wards, dtype=np.float32), (1, n_wards))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_knapsack_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    gains = rng.uniform(0, 10, 10)
+    costs = rng.integers(1, 6, 10).astype(np.float64)
+    for target in gains.sum() * np.array([0.1, 0.35, 0.6, 0.9]):
+        selected = ward_optimizer.knapsack_select(gains, costs, target, 1.0)
+        assert gains[selected].sum() >= target
+        assert costs[selected].sum() == brute_force_cost(gains, costs, target)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_greedy_never_beats_exact(seed):
+    rng = np.random.default_rng(seed)
+    gains = rng.uniform(0, 10, 12)
+    costs = rng.integers(1, 6, 12).astype(np.float64)
+    overlap = disjoint_overlap(len(gains))
+    for target in gains.sum() * np.array([0.1, 0.35, 0.6, 0.9]):
+        exact = ward_optimizer.knapsack_select(gains, costs, target, 1.0)
+        greedy, achieved = ward_optimizer.greedy_select(overlap, gains, costs, target)
+        assert achieved >= target
+        assert costs[greedy].sum() >= costs[exact].sum()
+
+
+def test_knapsack_matches_brute_force_on_city(data_service):
+    overlap = data_service.get_ward_overlap(SMALL_CITY)
+    gains = overlap.aggregate(data_service.load_dataset(SMALL_CITY).grid_matrix[:, 0])
+    costs = np.ones(overlap.n_wards)
+    for target in gains.sum() * np.array([0.05, 0.2, 0.4]):
+        selected = ward_optimizer.knapsack_select(gains, costs, target, 1.0)
+        assert len(selected) == brute_force_cost(gains, costs, target)
+
+
+@pytest.mark.parametrize("target", [2.0, 5.0, 10.0, 15.0, 20.0])
+def test_greedy_never_uses_fewer_wards_than_exact(data_service, target):
+    exact = data_service.optimize_wards(SMALL_CITY, 'co2', target, 100.0, method='exact')
+    greedy = data_service.optimize_wards(SMALL_CITY, 'co2', target, 100.0, method='greedy')
+    assert exact.target_met and greedy.target_met
+    assert greedy.ward_count >= exact.ward_count
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from conftest import SMALL_CITY
+from services.ward_overlap import WardOverlap
+
+# 4 x 4 grid of unit cells centred on 0.5 .. 3.5
+AXIS = np.arange(4) + 0.5
+
+
+def square(west, south, east, north):
+    return {'geometry': {'type': 'Polygon', 'coordinates': [
+        [[west, south], [east, south], [east, north], [west, north], [west, south]]]}}
+
+
+@pytest.fixture(scope="module")
+def split_grid():
+    # West ward covers a quarter of column 2, the east ward the rest of it but not row 3
+    features = [square(0, 0, 2.25, 4), square(2.25, 0, 4, 3)]
+    return WardOverlap.compute(features, AXIS, AXIS)
+
+
+def test_weights_sum_to_at_most_one_per_cell(split_grid):
+    raw = split_grid.raw_coverage(range(split_grid.n_wards))
+    assert raw.max() <= 1 + 1e-6
+    assert split_grid.weights.min() > 0
+
+
+def test_partial_coverage(split_grid):
+    raw = split_grid.raw_coverage(range(split_grid.n_wards)).reshape(4, 4)
+    west = split_grid.raw_coverage([0]).reshape(4, 4)
+    east = split_grid.raw_coverage([1]).reshape(4, 4)
+
+    assert west[:, :2] == pytest.approx(np.ones((4, 2)))
+    assert west[:, 2] == pytest.approx([0.25] * 4)
+    assert east[:3, 2] == pytest.approx([0.75] * 3)
+    # Cells split between the wards are covered once, cells outside both partly or not at all
+    assert raw[:3] == pytest.approx(np.ones((3, 4)))
+    assert raw[3] == pytest.approx([1, 1, 0.25, 0])
+
+
+def test_city_weights_sum_to_at_most_one_per_cell(data_service):
+    overlap = data_service.get_ward_overlap(SMALL_CITY)
+    raw = overlap.raw_coverage(range(overlap.n_wards))
+    assert raw.max() <= 1 + 1e-6
+    # Ward borders cut through cells, so some are only partly covered
+    assert ((raw > 0) & (raw < 1 - 1e-6)).any()
+
+
+def test_attribution_shares_add_up_to_cell_values(data_service):
+    overlap = data_service.get_ward_overlap(SMALL_CITY)
+    values = np.arange(overlap.n_cells, dtype=np.float64)
+    wards = list(range(overlap.n_wards))
+    covered = overlap.raw_coverage(wards) > 0
+    assert overlap.attribute(wards, values).sum() == pytest.approx(values[covered].sum())
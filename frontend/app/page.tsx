@@ -37,7 +37,8 @@ export default function Home() {
       setLoading(true)
       try {
         const data = await apiService.getCitiesWithPopulation()
-        setCitiesData(data)
+        // Listed cities without emissions data cannot be opened, so they are left off the map
+        setCitiesData(data.filter(city => city.has_data))
       } catch (error) {
         console.error('Error loading cities data:', error)
       } finally {
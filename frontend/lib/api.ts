@@ -29,6 +29,7 @@ export const apiService = {
     state: string
     lat: number
     lng: number
+    has_data: boolean
   }>> {
     try {
       const response = await api.get('/cities/population')
@@ -0,0 +1,206 @@
+"""
+Build every derived artifact of the city data read by the backend.
+
+Each data/<city>/data.json is turned into data/<city>/compiled/ (or
+$COMPILED_DIR/<city>/) with memory-mappable .npy grids and axes plus a
+separate geometry blob, simplified ward geometry for every level of detail,
+the ward features pre-encoded as served by /city, the ward x cell overlap
+matrix and the /city payloads with brotli and gzip variants. The artifacts
+are listed in the city's manifest together with ARTIFACTS_VERSION.
+
+Cities are built in parallel in a process pool. A city is skipped when its
+artifacts are current and data.json is unchanged: same mtime and size, or
+the same content hash (then only the recorded fingerprints are updated).
+Afterwards the city registry, the national index and
+data/others/build_manifest.json are updated.
+
+Usage:
+    python process_data.py                   # all cities
+    python process_data.py chennai indore    # selected cities
+    python process_data.py --dtype float32   # smaller grids
+    python process_data.py --force -j 4      # rebuild everything with 4 processes
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+
+from services import compiled_format, geometry_lod  # noqa: E402
+from services.city_registry import CityRegistry  # noqa: E402
+from services.city_cache import CityDataCache  # noqa: E402
+from services.national_index import NationalIndex  # noqa: E402
+from services.simple_data_service import SimpleDataService  # noqa: E402
+from services.ward_overlap import WardOverlap, OVERLAP_FILENAME, DEFAULT_SAMPLES  # noqa: E402
+from http_cache import CachedBody  # noqa: E402
+
+BUILD_MANIFEST = "build_manifest.json"
+
+# Per-process data service of build workers
+_worker_service: Optional[SimpleDataService] = None
+
+
+def find_cities(data_dir: Path):
+    """List city directories that contain a data.json"""
+    return sorted(p.name for p in data_dir.iterdir() if (p / "data.json").exists())
+
+
+def _init_worker(data_dir: str) -> None:
+    global _worker_service
+    # Each city is loaded once, so keep at most one in memory
+    _worker_service = SimpleDataService(data_dir, cache=CityDataCache(max_entries=1))
+
+
+def build_lods(out_dir: Path, manifest: dict):
+    """Precompute simplified ward geometry for each level of detail"""
+    with open(out_dir / "geometry.json", 'r') as f:
+        features = json.load(f).get('features', [])
+    for lod in range(1, geometry_lod.MAX_LOD + 1):
+        geometries = geometry_lod.lod_geometries(features, lod)
+        geometry_lod.save_lod_file(out_dir / geometry_lod.lod_filename(lod), manifest['source'], geometries)
+
+
+def build_payloads(service: SimpleDataService, city: str, out_dir: Path):
+    """Pre-encode the ward features and the /city payload of every level of detail, with compressed variants"""
+    dataset = service.load_dataset(city)
+    for lod in range(geometry_lod.MAX_LOD + 1):
+        service.roads_json(dataset, lod)
+        CachedBody(service.load_city_json(city, lod=lod)).write_files(out_dir / compiled_format.payload_filename(lod))
+
+
+def retag(source: Path, out_dir: Path, manifest: Dict[str, Any], sha1: str) -> None:
+    """Point the artifacts of an unchanged source (same content, new mtime) at its current fingerprint"""
+    recorded = manifest['source']
+    stat = source.stat()
+    current = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': sha1}
+
+    for lod in range(1, geometry_lod.MAX_LOD + 1):
+        lod_file = out_dir / geometry_lod.lod_filename(lod)
+        geometries = geometry_lod.load_lod_file(lod_file, recorded)
+        if geometries is not None:
+            geometry_lod.save_lod_file(lod_file, current, geometries)
+    overlap = WardOverlap.load(out_dir / OVERLAP_FILENAME, recorded, DEFAULT_SAMPLES)
+    if overlap is not None:
+        overlap.save(out_dir / OVERLAP_FILENAME, current, DEFAULT_SAMPLES)
+
+    manifest['source'] = current
+    compiled_format.write_manifest(out_dir, manifest)
+
+
+def build_city(data_dir: str, city: str, dtype: str, force: bool) -> Dict[str, Any]:
+    """Bring the artifacts of one city up to date (runs in a worker process)"""
+    started = time.perf_counter()
+    service = _worker_service or SimpleDataService(data_dir, cache=CityDataCache(max_entries=1))
+    source = Path(data_dir) / city / "data.json"
+    out_dir = compiled_format.compiled_dir(Path(data_dir), city)
+
+    manifest = compiled_format.read_manifest(out_dir)
+    if (not force and manifest is not None and manifest.get('dtype') == dtype
+            and compiled_format.artifacts_current(out_dir, manifest)):
+        recorded = manifest['source']
+        stat = source.stat()
+        if stat.st_size == recorded['size'] and stat.st_mtime_ns == recorded['mtime_ns']:
+            return {'city': city, 'status': 'skipped', 'sha1': recorded['sha1'], 'seconds': 0.0}
+        if stat.st_size == recorded['size']:
+            sha1 = compiled_format.file_sha1(source)
+            if sha1 == recorded['sha1']:
+                retag(source, out_dir, manifest, sha1)
+                return {'city': city, 'status': 'retagged', 'sha1': sha1,
+                        'seconds': time.perf_counter() - started}
+
+    with compiled_format.build_lock(out_dir):
+        manifest = compiled_format.compile_city(source, out_dir, dtype=dtype)
+        build_lods(out_dir, manifest)
+        service.get_ward_overlap(city)
+        build_payloads(service, city, out_dir)
+
+        files = {path.name: path.stat().st_size for path in sorted(out_dir.iterdir())
+                 if path.is_file() and path.name != "manifest.json"}
+        manifest['artifacts'] = {'version': compiled_format.ARTIFACTS_VERSION, 'files': files}
+        compiled_format.write_manifest(out_dir, manifest)
+
+    return {'city': city, 'status': 'built', 'sha1': manifest['source']['sha1'],
+            'seconds': time.perf_counter() - started, 'bytes': sum(files.values())}
+
+
+def write_build_manifest(data_dir: Path, results: Dict[str, Dict[str, Any]]) -> None:
+    """Record the source hash and outcome of every city, keeping cities not built in this run"""
+    path = data_dir / "others" / BUILD_MANIFEST
+    try:
+        with open(path, 'r') as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        stored = {}
+    cities = stored.get('cities', {}) if stored.get('version') == compiled_format.ARTIFACTS_VERSION else {}
+    now = datetime.now(timezone.utc).isoformat()
+    for city, result in results.items():
+        entry = {'sha1': result['sha1'], 'status': result['status']}
+        if result['status'] == 'skipped' and city in cities:
+            entry['built_at'] = cities[city].get('built_at')
+        else:
+            entry['built_at'] = now
+        cities[city] = entry
+    compiled_format.write_artifact(path, json.dumps({
+        'version': compiled_format.ARTIFACTS_VERSION,
+        'updated_at': now,
+        'cities': dict(sorted(cities.items())),
+    }, indent=2).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the compiled data and derived artifacts of every city")
+    parser.add_argument("cities", nargs="*", help="Cities to build (default: all)")
+    parser.add_argument("--data-dir", default=str(ROOT_DIR / "data"), help="Data directory")
+    parser.add_argument("--dtype", default="float64", choices=["float32", "float64"], help="Grid dtype")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if up to date")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    cities = args.cities or find_cities(data_dir)
+    missing = [city for city in cities if not (data_dir / city / "data.json").exists()]
+    for city in missing:
+        print(f"⚠️  {city}: no data.json, skipping")
+    cities = [city for city in cities if city not in missing]
+
+    start = time.perf_counter()
+    results: Dict[str, Dict[str, Any]] = {}
+    failed = []
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=_init_worker,
+                             initargs=(str(data_dir),)) as pool:
+        futures = {pool.submit(build_city, str(data_dir), city, args.dtype, args.force): city for city in cities}
+        for future in as_completed(futures):
+            city = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed.append(city)
+                print(f"❌ {city}: {e}")
+                continue
+            results[city] = result
+            if result['status'] == 'built':
+                print(f"✅ {city} ({result['seconds']:.1f}s, {result['bytes'] / 1024:.0f} KiB)")
+            elif result['status'] == 'retagged':
+                print(f"🔁 {city}: content unchanged, fingerprints updated")
+
+    write_build_manifest(data_dir, results)
+    registry = CityRegistry.load(data_dir)
+    updated = NationalIndex(data_dir).refresh()
+
+    elapsed = time.perf_counter() - start
+    built = sum(1 for r in results.values() if r['status'] == 'built')
+    print(f"Built {built} of {len(cities)} cities in {elapsed:.1f}s, {len(registry)} cities registered, "
+          f"{len(updated)} updated in the national index")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()